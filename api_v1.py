@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Read-only JSON API (v1) for the list, levels, players and records
+Levels and players are served from the same cache as the HTML pages
+"""
+
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, request, url_for
+
+# Use orjson when it is installed, it is several times faster than json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+LEVEL_FIELDS = [
+    'id', 'name', 'creator', 'verifier', 'level_id', 'video_url', 'thumbnail_url',
+    'description', 'difficulty', 'position', 'is_legacy', 'level_type', 'points',
+    'min_percentage', 'date_added'
+]
+PLAYER_FIELDS = ['id', 'username', 'points', 'date_joined']
+RECORD_FIELDS = ['id', 'user_id', 'level_id', 'progress', 'video_url', 'status', 'date_submitted']
+
+
+# App state is looked up through app.extensions to avoid circular imports
+def get_db():
+    return current_app.extensions['mongo_db']
+
+def get_cached(name):
+    return current_app.extensions['get_cached_list'](name)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(data):
+    """Serialize to compact JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200, etag=None):
+    body = b'' if status == 304 else dumps(data)
+    response = Response(body, status=status, mimetype='application/json')
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+@api_v1.errorhandler(ApiError)
+def handle_api_error(error):
+    return json_response({"error": error.message}, status=error.status)
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ApiError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ApiError('Invalid cursor')
+    return values
+
+
+def parse_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def parse_fields(allowed):
+    """Parse ?fields=a,b,c and validate against the allowed list"""
+    raw = request.args.get('fields')
+    if not raw:
+        return allowed
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag):
+    return request.if_none_match.contains_weak(etag)
+
+
+def serialize(doc, fields):
+    """Map a Mongo document to API fields (_id becomes id)"""
+    item = {}
+    for field in fields:
+        value = doc.get('_id') if field == 'id' else doc.get(field)
+        if field == 'thumbnail_url':
+            if doc.get('thumbnail_hash'):
+                value = url_for('thumbnail', digest=doc['thumbnail_hash'], _external=True)
+            # Inline base64 thumbnails are far too large for list responses
+            elif isinstance(value, str) and value.startswith('data:'):
+                value = None
+        item[field] = value
+    return item
+
+
+@api_v1.route('/levels')
+def levels():
+    list_name = request.args.get('list', 'main')
+    if list_name not in ('main', 'legacy'):
+        raise ApiError("list must be 'main' or 'legacy'")
+    limit = parse_limit()
+    fields = parse_fields(LEVEL_FIELDS)
+    cursor = request.args.get('cursor')
+
+    entry = get_cached(list_name)
+    etag = make_etag('levels', entry.version, list_name, limit, fields, cursor)
+    if not_modified(etag):
+        return json_response(None, status=304, etag=etag)
+
+    # Keyset pagination on position (the list is kept sorted by position)
+    items = entry.items
+    if cursor:
+        after_position, = decode_cursor(cursor, 1)
+        items = [level for level in items if level['position'] > after_position]
+    page = items[:limit]
+
+    next_cursor = None
+    if len(items) > limit:
+        next_cursor = encode_cursor(page[-1]['position'])
+
+    return json_response({
+        "data": [serialize(level, fields) for level in page],
+        "next_cursor": next_cursor
+    }, etag=etag)
+
+
+@api_v1.route('/levels/<int:level_id>')
+def level(level_id):
+    fields = parse_fields(LEVEL_FIELDS)
+
+    entry = get_cached('main')
+    found = entry.by_id().get(level_id)
+    if found is None:
+        entry = get_cached('legacy')
+        found = entry.by_id().get(level_id)
+    if found is None:
+        raise ApiError('Level not found', status=404)
+
+    etag = make_etag('level', entry.version, level_id, fields)
+    if not_modified(etag):
+        return json_response(None, status=304, etag=etag)
+    return json_response({"data": serialize(found, fields)}, etag=etag)
+
+
+@api_v1.route('/players')
+def players():
+    limit = parse_limit()
+    fields = parse_fields(PLAYER_FIELDS)
+    cursor = request.args.get('cursor')
+
+    entry = get_cached('players')
+    etag = make_etag('players', entry.version, limit, fields, cursor)
+    if not_modified(etag):
+        return json_response(None, status=304, etag=etag)
+
+    # Keyset pagination on (points desc, _id asc)
+    items = entry.items
+    if cursor:
+        after_points, after_id = decode_cursor(cursor, 2)
+        items = [
+            player for player in items
+            if (player.get('points') or 0) < after_points
+            or ((player.get('points') or 0) == after_points and player['_id'] > after_id)
+        ]
+    page = items[:limit]
+
+    next_cursor = None
+    if len(items) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last.get('points') or 0, last['_id'])
+
+    return json_response({
+        "data": [serialize(player, fields) for player in page],
+        "next_cursor": next_cursor
+    }, etag=etag)
+
+
+@api_v1.route('/records')
+def records():
+    limit = parse_limit()
+    fields = parse_fields(RECORD_FIELDS)
+    cursor = request.args.get('cursor')
+
+    # Only approved records are public
+    query = {"status": "approved"}
+    for param in ('level_id', 'user_id'):
+        value = request.args.get(param)
+        if value is not None:
+            try:
+                query[param] = int(value)
+            except ValueError:
+                raise ApiError(f'{param} must be an integer')
+
+    # Keyset pagination on _id
+    if cursor:
+        after_id, = decode_cursor(cursor, 1)
+        query["_id"] = {"$gt": after_id}
+
+    projection = {f: 1 for f in fields if f != 'id'}
+    docs = list(get_db().records.find(query, projection).sort("_id", 1).limit(limit + 1))
+    page = docs[:limit]
+
+    next_cursor = None
+    if len(docs) > limit:
+        next_cursor = encode_cursor(page[-1]['_id'])
+
+    body = {
+        "data": [serialize(record, fields) for record in page],
+        "next_cursor": next_cursor
+    }
+    etag = make_etag('records', dumps(body))
+    if not_modified(etag):
+        return json_response(None, status=304, etag=etag)
+    return json_response(body, etag=etag)
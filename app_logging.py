@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Logging for the web app and the Discord bot
+The root logger gets a QueueHandler, so a thread that logs never waits on
+stdout; a QueueListener thread formats and writes the records. Every record
+carries the ID of the request it was logged in, and INFO/DEBUG records of
+requests that were not sampled are dropped.
+
+    LOG_LEVEL=INFO                       level of the root logger
+    LOG_LEVELS=rtl.requests=DEBUG,...    per-logger overrides
+    LOG_FORMAT=text                      or json, one object per line
+    LOG_SAMPLE_RATE=1.0                  share of requests whose INFO/DEBUG records are kept
+
+Loggers are named rtl.<area> (rtl.web, rtl.requests, rtl.discord, rtl.bot,
+rtl.outbox, rtl.health, rtl.thumbnails). Pass structured fields with
+extra={...}; expensive debug output should be guarded with
+log.isEnabledFor(logging.DEBUG).
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+
+
+def _parse_levels(value):
+    """LOG_LEVELS="rtl.requests=DEBUG,pymongo=WARNING" """
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+LOG_LEVELS = _parse_levels(os.environ.get('LOG_LEVELS', ''))
+
+# (request id, sampled) for the request or command being handled in this thread/task
+_request = contextvars.ContextVar('rtl_request', default=None)
+
+# Accept a caller's X-Request-ID only if it looks like an ID
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def begin_request(request_id=None):
+    """Tag the records that follow with a request ID and decide whether they are sampled"""
+    if not request_id or not _REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    sampled = LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+    _request.set((request_id, sampled))
+    return request_id
+
+
+def end_request():
+    _request.set(None)
+
+
+def current_request_id():
+    context = _request.get()
+    return context[0] if context else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds record.request_id and applies request sampling (in the logging thread)"""
+
+    def filter(self, record):
+        context = _request.get()
+        record.request_id = context[0] if context else '-'
+        if context and not context[1] and record.levelno < logging.WARNING:
+            return False
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Only merge the arguments here; formatting happens on the listener thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_STANDARD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_FIELDS}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s')
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        extra = _extra_fields(record)
+        if extra:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in extra.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, 'request_id', '-'),
+            "message": record.getMessage(),
+        }
+        data.update(_extra_fields(record))
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+_handler = None
+_listener = None
+
+
+def _output_handler():
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    return output
+
+
+def setup_logging():
+    """Route all logging through the queue (safe to call more than once)"""
+    global _handler, _listener
+    if _handler is not None:
+        return
+    _handler = _QueueHandler(queue.SimpleQueue())
+    _handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_handler.queue, _output_handler())
+    _listener.start()
+    atexit.register(_stop)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _stop():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # The listener thread stays behind in the parent: give the child its own queue and thread
+    global _listener
+    if _handler is None:
+        return
+    _handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_handler.queue, _output_handler())
+    _listener.start()
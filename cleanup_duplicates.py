@@ -6,6 +6,7 @@ Script to clean up duplicate levels and keep only ones with images
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
+from thumbnail_dedup import release_reference
 
 # Load environment variables
 load_dotenv()
@@ -45,6 +46,14 @@ def find_duplicates(db):
     duplicates = list(db.levels.aggregate(pipeline))
     return duplicates
 
+def has_thumbnail(level):
+    return bool(level.get('thumbnail_hash') or (level.get('thumbnail_url') or '').strip())
+
+def describe_thumbnail(level):
+    if level.get('thumbnail_hash'):
+        return f"/thumbnails/{level['thumbnail_hash'][:12]}..."
+    return f"{level['thumbnail_url'][:50]}..."
+
 def cleanup_duplicates(db):
     """Remove duplicates, keeping levels with images"""
     duplicates = find_duplicates(db)
@@ -59,9 +68,9 @@ def cleanup_duplicates(db):
         
         print(f"\nDuplicate: '{name}' ({len(levels)} copies)")
         
-        # Sort levels: prioritize ones with thumbnail_url, then by _id (newer first)
+        # Sort levels: prioritize ones with a thumbnail, then by _id (newer first)
         levels.sort(key=lambda x: (
-            bool(x.get('thumbnail_url', '').strip()),  # Has thumbnail
+            has_thumbnail(x),  # Has thumbnail
             x.get('_id', 0)  # Newer ID
         ), reverse=True)
         
@@ -70,20 +79,21 @@ def cleanup_duplicates(db):
         remove_levels = levels[1:]
         
         print(f"  Keeping: ID {keep_level['_id']} - {keep_level['name']}")
-        if keep_level.get('thumbnail_url'):
-            print(f"    Has thumbnail: {keep_level['thumbnail_url'][:50]}...")
+        if has_thumbnail(keep_level):
+            print(f"    Has thumbnail: {describe_thumbnail(keep_level)}")
         else:
             print("    No thumbnail")
             
         for level in remove_levels:
             print(f"  Removing: ID {level['_id']} - {level['name']}")
-            if level.get('thumbnail_url'):
-                print(f"    Had thumbnail: {level['thumbnail_url'][:50]}...")
+            if has_thumbnail(level):
+                print(f"    Had thumbnail: {describe_thumbnail(level)}")
             else:
                 print("    No thumbnail")
                 
             # Remove the level
             db.levels.delete_one({"_id": level['_id']})
+            release_reference(level.get('thumbnail_hash'))
             removed_count += 1
     
     return removed_count
@@ -94,8 +104,7 @@ def list_all_levels(db):
     
     print(f"\nAll levels in database ({len(levels)} total):")
     for level in levels:
-        has_thumbnail = bool(level.get('thumbnail_url', '').strip())
-        thumbnail_info = "📷" if has_thumbnail else "❌"
+        thumbnail_info = "📷" if has_thumbnail(level) else "❌"
         print(f"  {level.get('position', '?'):3d}. {level['name']} (ID: {level['_id']}) {thumbnail_info}")
     
     return levels
@@ -130,8 +139,8 @@ def main():
         
         print(f"\nSummary:")
         print(f"  Total levels: {len(final_levels)}")
-        print(f"  Levels with thumbnails: {sum(1 for l in final_levels if l.get('thumbnail_url', '').strip())}")
-        print(f"  Levels without thumbnails: {sum(1 for l in final_levels if not l.get('thumbnail_url', '').strip())}")
+        print(f"  Levels with thumbnails: {sum(1 for l in final_levels if has_thumbnail(l))}")
+        print(f"  Levels without thumbnails: {sum(1 for l in final_levels if not has_thumbnail(l))}")
         
     finally:
         client.close()
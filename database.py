@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+MongoDB connection for the web app
+The client is built the first time a query needs it instead of at import,
+so importing main (tests, CLI tools, freshly forked workers) never waits on
+the database
+
+MongoClient is not fork-safe: each process builds its own, and a client
+inherited across fork() is dropped in the child (see gunicorn.conf.py)
+
+Instead of one socket timeout for everything, operations get a deadline by
+class (pymongo.timeout): page reads are short, admin writes and batch jobs
+are allowed to run longer. Pool checkouts are timed so that waiting for a
+connection shows up in pool_metrics().
+"""
+
+import os
+import threading
+import time
+
+import pymongo
+from pymongo import MongoClient, monitoring
+
+# Pool per process; every gunicorn worker has its own
+MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', '20'))
+# Idle connections are closed after this long
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', '60000'))
+# Longest wait for a free connection outside an operation timeout (inside one, its deadline applies)
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', '5000'))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+
+# operation class -> seconds every database call in one block may take together
+OPERATION_TIMEOUTS = {
+    'page': 5,      # interactive page and API reads
+    'admin': 60,    # admin writes and recomputes
+    'batch': 300,   # background threads and maintenance jobs
+}
+
+
+def _parse_timeouts(value):
+    """MONGODB_TIMEOUTS="page=5,admin=60,batch=300" (seconds)"""
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, seconds = item.partition('=')
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+OPERATION_TIMEOUTS.update(_parse_timeouts(os.environ.get('MONGODB_TIMEOUTS', '')))
+
+
+def operation_timeout(kind):
+    """Context manager giving every operation inside it one shared deadline"""
+    return pymongo.timeout(OPERATION_TIMEOUTS[kind])
+
+
+def request_operation(method, path):
+    """Operation class of a web request"""
+    if path.startswith('/admin') and method not in ('GET', 'HEAD'):
+        return 'admin'
+    return 'page'
+
+
+class OperationTimeouts:
+    """WSGI middleware putting each request's database calls under its class's deadline
+
+    A streamed body is read after the view returns, so each chunk gets a
+    fresh deadline of its own.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        kind = request_operation(environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', ''))
+        with operation_timeout(kind):
+            body = self.wsgi_app(environ, start_response)
+        # Files (thumbnails) are sent as they are so the server can still use sendfile
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            return body
+        return TimedBody(body, kind)
+
+
+class TimedBody:
+    """Response body whose every chunk is read under an operation deadline
+
+    close() is forwarded straight to the wrapped body (like werkzeug's
+    ClosingIterator), so Flask's teardown still runs when the server closes
+    the response before reading it.
+    """
+
+    def __init__(self, body, kind):
+        self.body = body
+        self.kind = kind
+        self._iterator = iter(body)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with operation_timeout(self.kind):
+            return next(self._iterator)
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connection checkouts and how long they waited, per server"""
+
+    # Upper bounds (ms) of the wait-time histogram buckets
+    BUCKETS = (1, 5, 25, 100, 500, 2000)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self.servers = {}
+        self.since = time.time()
+
+    def _server(self, address):
+        key = f"{address[0]}:{address[1]}"
+        server = self.servers.get(key)
+        if server is None:
+            server = self.servers[key] = {
+                "checkouts": 0, "failed_checkouts": {}, "in_use": 0, "open": 0,
+                "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+                "wait_ms_buckets": {f"<={b}": 0 for b in self.BUCKETS} | {"more": 0},
+            }
+        return server
+
+    def connection_checked_out(self, event):
+        wait_ms = (event.duration or 0) * 1000
+        with self._lock:
+            server = self._server(event.address)
+            server["checkouts"] += 1
+            server["in_use"] += 1
+            server["wait_ms_total"] += wait_ms
+            server["wait_ms_max"] = max(server["wait_ms_max"], wait_ms)
+            bucket = next((f"<={b}" for b in self.BUCKETS if wait_ms <= b), "more")
+            server["wait_ms_buckets"][bucket] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            failed = self._server(event.address)["failed_checkouts"]
+            failed[event.reason] = failed.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["in_use"] = max(server["in_use"] - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["open"] = max(server["open"] - 1, 0)
+
+    # Required by the interface; nothing to count
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            servers = {}
+            for key, server in self.servers.items():
+                checkouts = server["checkouts"]
+                servers[key] = dict(
+                    server,
+                    failed_checkouts=dict(server["failed_checkouts"]),
+                    wait_ms_buckets=dict(server["wait_ms_buckets"]),
+                    wait_ms_total=round(server["wait_ms_total"], 1),
+                    wait_ms_max=round(server["wait_ms_max"], 1),
+                    wait_ms_avg=round(server["wait_ms_total"] / checkouts, 2) if checkouts else None,
+                )
+            return {"since": self.since, "servers": servers}
+
+
+pool_listener = PoolMetrics()
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+def mongodb_uri():
+    return os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
+
+
+def client_options(**overrides):
+    """Connection options for any client of the cluster (web app, bot, CLI tools)"""
+    options = dict(
+        tls=True,
+        tlsAllowInvalidCertificates=True,
+        tlsAllowInvalidHostnames=True,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+    )
+    options.update(overrides)
+    return options
+
+
+def get_client():
+    """This process's MongoClient, created on first use
+
+    connect=False: the driver only opens sockets when the first operation runs.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(
+                    mongodb_uri(),
+                    **client_options(),
+                    # Only for calls outside operation_timeout(); inside one the deadline wins
+                    socketTimeoutMS=int(OPERATION_TIMEOUTS['batch'] * 1000),
+                    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                    maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                    waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                    event_listeners=[pool_listener],
+                    connect=False
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def close_client():
+    """Close this process's client, e.g. in the gunicorn master before it forks workers"""
+    global _client
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+
+def _after_fork_in_child():
+    # The parent's sockets and monitor threads are not ours: forget the client
+    # without closing it, and replace a lock that may have been held mid-fork
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+    pool_listener.reset()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def pool_metrics():
+    """Connection pool usage and checkout wait times for this process"""
+    return pool_listener.snapshot()
+
+
+def get_db():
+    return get_client()[os.environ.get('MONGODB_DB', 'rtl_database')]
+
+
+class LazyDatabase:
+    """Stands in for the pymongo Database; nothing is created until it is used"""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+    def __repr__(self):
+        return f"LazyDatabase(connected={_client is not None})"
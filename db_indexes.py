@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Declarative MongoDB index spec
+Reconciled at app startup, or from the command line:
+
+    python db_indexes.py            # create missing / changed indexes
+    python db_indexes.py --prune    # also drop indexes that are not in the spec
+    python db_indexes.py --verify   # explain() every hot query, exit 1 on COLLSCAN
+"""
+
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# collection -> list of index definitions. Every index is named explicitly
+# so that reconciling can tell "missing" apart from "changed".
+INDEX_SPEC = {
+    'users': [
+        {'name': 'username_unique', 'keys': [('username', ASCENDING)], 'unique': True},
+        {'name': 'email_unique', 'keys': [('email', ASCENDING)], 'unique': True},
+        # Partial instead of sparse: accounts created without Google store google_id as null
+        {'name': 'google_id_unique', 'keys': [('google_id', ASCENDING)], 'unique': True,
+         'partialFilterExpression': {'google_id': {'$type': 'string'}}},
+        {'name': 'points_desc', 'keys': [('points', DESCENDING), ('_id', ASCENDING)]},
+    ],
+    'levels': [
+        {'name': 'is_legacy_1_position_1', 'keys': [('is_legacy', ASCENDING), ('position', ASCENDING)]},
+    ],
+    'records': [
+        {'name': 'user_status', 'keys': [('user_id', ASCENDING), ('status', ASCENDING)]},
+        {'name': 'level_status', 'keys': [('level_id', ASCENDING), ('status', ASCENDING)]},
+        {'name': 'status_id', 'keys': [('status', ASCENDING), ('_id', ASCENDING)]},
+    ],
+    'level_history': [
+        {'name': 'level_timestamp', 'keys': [('level_id', ASCENDING), ('timestamp', ASCENDING)]},
+    ],
+    'notification_outbox': [
+        {'name': 'status_next_attempt', 'keys': [('status', ASCENDING), ('next_attempt_at', ASCENDING)]},
+        # Delivered messages are kept for a week for debugging, then expire
+        {'name': 'sent_ttl', 'keys': [('sent_at', ASCENDING)], 'expireAfterSeconds': 7 * 24 * 3600},
+    ],
+}
+
+# Queries the app runs on every page view or admin action. Each one must be
+# answered from an index; --verify fails if any of them plans a COLLSCAN.
+HOT_QUERIES = [
+    ('levels', {'is_legacy': False}, [('position', ASCENDING)]),
+    ('levels', {'is_legacy': True}, [('position', ASCENDING)]),
+    ('records', {'user_id': 1, 'status': 'approved'}, None),
+    ('records', {'level_id': 1, 'status': 'approved'}, None),
+    ('records', {'status': 'pending'}, None),
+    ('records', {'status': 'approved'}, [('_id', ASCENDING)]),
+    ('records', {'user_id': 1}, None),
+    ('users', {'google_id': 'google-oauth-subject'}, None),
+    ('users', {'username': 'someone'}, None),
+    ('users', {'email': 'someone@example.com'}, None),
+    ('users', {}, [('points', DESCENDING), ('_id', ASCENDING)]),
+    ('level_history', {'level_id': 1}, [('timestamp', ASCENDING)]),
+    ('notification_outbox', {'status': 'pending', 'next_attempt_at': {'$lte': datetime(2000, 1, 1)}}, [('next_attempt_at', ASCENDING)]),
+]
+
+# Index options that are compared when deciding whether an index changed
+COMPARED_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+
+def _options(definition):
+    return {k: v for k, v in definition.items() if k in COMPARED_OPTIONS}
+
+
+def _matches(existing, definition):
+    if [tuple(k) for k in existing['key']] != [tuple(k) for k in definition['keys']]:
+        return False
+    return {k: existing.get(k) for k in COMPARED_OPTIONS if k in existing} == _options(definition)
+
+
+def _duplicate_key(collection, definition):
+    """A key value held by several documents (which a unique index would reject), or None"""
+    match = dict(definition.get('partialFilterExpression', {}))
+    if definition.get('sparse'):
+        match.update({field: {'$exists': True} for field, _ in definition['keys']})
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': {field.replace('.', '_'): f'${field}' for field, _ in definition['keys']},
+                    'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': 1},
+    ]
+    duplicate = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+    return duplicate['_id'] if duplicate else None
+
+
+def _rebuild(collection, name, current, definition):
+    """Replace an index whose definition changed, keeping the old one if the new one cannot be built"""
+    if definition.get('unique'):
+        duplicate = _duplicate_key(collection, definition)
+        if duplicate is not None:
+            raise OperationFailure(f"duplicate key {duplicate} blocks the unique index; kept the old index")
+    collection.drop_index(name)
+    try:
+        collection.create_index(definition['keys'], name=name, **_options(definition))
+    except OperationFailure:
+        # Put the previous index back rather than leave the collection without one
+        collection.create_index([tuple(k) for k in current['key']], name=name, **_options(current))
+        raise
+
+
+def ensure_indexes(db, prune=False):
+    """Bring the indexes of every collection in INDEX_SPEC in line with the spec
+
+    Returns a list of (collection, index name, action) describing what was done.
+    Failures (e.g. duplicate keys blocking a unique index) are reported as
+    'error: ...' actions rather than raised, so startup is never blocked; a
+    changed index is only dropped once its replacement is known to build.
+    """
+    changes = []
+    for collection_name, definitions in INDEX_SPEC.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        wanted = {d['name'] for d in definitions}
+
+        for definition in definitions:
+            name = definition['name']
+            current = existing.get(name)
+            # Same keys under a different (auto-generated) name counts as present
+            if current is None:
+                for other_name, other in existing.items():
+                    if other_name not in wanted and _matches(other, definition):
+                        current = other
+                        wanted.add(other_name)
+                        break
+            if current is not None and _matches(current, definition):
+                continue
+
+            try:
+                if current is not None:
+                    _rebuild(collection, name, current, definition)
+                    action = 'rebuilt'
+                else:
+                    collection.create_index(definition['keys'], name=name, **_options(definition))
+                    action = 'created'
+                changes.append((collection_name, name, action))
+            except OperationFailure as e:
+                changes.append((collection_name, name, f'error: {e}'))
+
+        if prune:
+            for name in existing:
+                if name != '_id_' and name not in wanted:
+                    collection.drop_index(name)
+                    changes.append((collection_name, name, 'dropped'))
+    return changes
+
+
+def _stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _stages(child)
+
+
+def verify_query_plans(db):
+    """explain() every hot query; return [(collection, filter, stages)] that use COLLSCAN"""
+    failures = []
+    for collection_name, query, sort in HOT_QUERIES:
+        command = {'find': collection_name, 'filter': query}
+        if sort:
+            command['sort'] = dict(sort)
+        explain = db.command('explain', command, verbosity='queryPlanner')
+        stages = list(_stages(explain['queryPlanner']['winningPlan']))
+        if 'COLLSCAN' in stages:
+            failures.append((collection_name, query, stages))
+    return failures
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from database import get_db
+    db = get_db()
+
+    changes = ensure_indexes(db, prune='--prune' in sys.argv)
+    for collection_name, name, action in changes:
+        print(f"{collection_name}.{name}: {action}")
+    if not changes:
+        print("✓ Indexes already match the spec")
+
+    if '--verify' in sys.argv:
+        failures = verify_query_plans(db)
+        for collection_name, query, stages in failures:
+            print(f"❌ COLLSCAN on {collection_name} for {query}: {' -> '.join(stages)}")
+        if failures:
+            sys.exit(1)
+        print(f"✓ All {len(HOT_QUERIES)} hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
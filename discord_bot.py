@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 """
 Discord bot for RTL (Recent Tab List) notifications
-Sends alerts to admin channel when records are submitted
+Sends alerts to admin channel when records are submitted, and answers
+!rtl top / level / player / pending from a short-lived query cache
+
+With NOTIFICATION_TRANSPORT=bot the bot delivers the web app's
+notification outbox itself: it follows inserts with a change stream (its
+resume token is kept in the bot_state collection) and claims messages
+exactly like the web app's outbox worker, which then stays idle.
 """
 
 import discord
@@ -10,15 +16,45 @@ import os
 from dotenv import load_dotenv
 import asyncio
 import aiohttp
-from datetime import datetime
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import OperationFailure
+
+import notification_outbox as outbox
+from app_logging import setup_logging, begin_request
+from discord_integration import SEND_BUDGET, build_embeds, chunk_embeds, record_submitted_embed, record_approved_embed
+from database import client_options
 
 # Load environment variables
 load_dotenv()
+setup_logging()
+log = logging.getLogger('rtl.bot')
 
 # Bot configuration
 DISCORD_TOKEN = os.environ.get('DISCORD_BOT_TOKEN')
 ADMIN_CHANNEL_ID = int(os.environ.get('DISCORD_ADMIN_CHANNEL_ID', '0'))
 GUILD_ID = int(os.environ.get('DISCORD_GUILD_ID', '0'))
+NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT', 'webhook').lower()
+
+MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
+MONGODB_DB = os.environ.get('MONGODB_DB', 'rtl_database')
+_mongo_client = None
+
+OUTBOX_STREAM_STATE = 'outbox_change_stream'
+# Server error codes: resume point fell off the oplog / change streams not available
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAMS_UNSUPPORTED = {40573, 20}
+
+WEBSITE_URL = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
+
+# Seconds a command's query result is reused; BOT_CACHE_TTL scales them all
+CACHE_TTL_SCALE = float(os.environ.get('BOT_CACHE_TTL', '1'))
+CACHE_TTLS = {'top': 60, 'level': 60, 'player': 30, 'pending': 10}
+CACHE_MAX_ENTRIES = 512
 
 # Bot setup
 intents = discord.Intents.default()
@@ -28,8 +64,7 @@ bot = commands.Bot(command_prefix='!rtl ', intents=intents)
 @bot.event
 async def on_ready():
     """Bot startup event"""
-    print(f'✅ RTL Discord Bot logged in as {bot.user}')
-    print(f'📊 Connected to {len(bot.guilds)} servers')
+    log.info("RTL Discord Bot logged in as %s, connected to %d servers", bot.user, len(bot.guilds))
     
     # Set bot status
     activity = discord.Activity(type=discord.ActivityType.watching, name="RTL submissions")
@@ -56,117 +91,357 @@ async def status(ctx):
     embed.add_field(name="Status", value="✅ Online", inline=True)
     embed.add_field(name="Servers", value=len(bot.guilds), inline=True)
     embed.add_field(name="Latency", value=f"{round(bot.latency * 1000)}ms", inline=True)
+    embed.add_field(name="Query cache", value=f"{cache.hits} hits / {cache.misses} queries", inline=True)
     embed.timestamp = datetime.utcnow()
     
     await ctx.send(embed=embed)
 
-async def send_record_notification(record_data):
-    """Send notification when a new record is submitted"""
-    if not ADMIN_CHANNEL_ID:
-        print("❌ No admin channel ID configured")
-        return
-    
-    try:
-        channel = bot.get_channel(ADMIN_CHANNEL_ID)
-        if not channel:
-            print(f"❌ Could not find channel with ID {ADMIN_CHANNEL_ID}")
-            return
-        
-        # Create embed for the notification
-        embed = discord.Embed(
-            title="📝 New Record Submission",
-            description="A new record has been submitted for review",
-            color=0xfbbf24,  # Yellow/warning color
-            timestamp=datetime.utcnow()
-        )
-        
-        # Add record details
-        embed.add_field(
-            name="👤 Player", 
-            value=record_data.get('username', 'Unknown'), 
-            inline=True
-        )
-        embed.add_field(
-            name="🎮 Level", 
-            value=record_data.get('level_name', 'Unknown'), 
-            inline=True
-        )
-        embed.add_field(
-            name="📊 Progress", 
-            value=f"{record_data.get('progress', 0)}%", 
-            inline=True
-        )
-        
-        if record_data.get('video_url'):
-            embed.add_field(
-                name="🎥 Video", 
-                value=f"[Watch Video]({record_data['video_url']})", 
-                inline=False
-            )
-        
-        # Add admin panel link
-        website_url = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
-        embed.add_field(
-            name="⚙️ Admin Panel", 
-            value=f"[Review Submission]({website_url}/admin)", 
-            inline=False
+class AsyncTTLCache:
+    """Read-through cache shared by the list commands
+
+    A value is reused for its TTL, and concurrent misses for the same key
+    wait on one query instead of each hitting the database.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires_at, value)
+        self._loading = {}  # key -> task running the loader
+        self.hits = self.misses = 0
+
+    async def get(self, key, ttl, loader):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._loading.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, ttl, loader))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        # shield: one caller being cancelled must not cancel the query the others wait on
+        return await asyncio.shield(task)
+
+    async def _load(self, key, ttl, loader):
+        value = await loader()
+        self._entries[key] = (time.monotonic() + ttl * CACHE_TTL_SCALE, value)
+        if len(self._entries) > self.max_entries:
+            self._evict()
+        return value
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        # Still full: drop the oldest entries (dicts keep insertion order)
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+cache = AsyncTTLCache()
+
+def exact_name(name):
+    """Case-insensitive whole-string match for a user-typed name"""
+    return {"$regex": f"^{re.escape(name.strip())}$", "$options": "i"}
+
+async def load_top(limit=10):
+    cursor = get_db().levels.find(
+        {"is_legacy": False},
+        {"name": 1, "creator": 1, "points": 1, "position": 1}
+    ).sort("position", 1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+async def load_level(name):
+    db = get_db()
+    fields = {"name": 1, "creator": 1, "verifier": 1, "position": 1, "points": 1,
+              "difficulty": 1, "is_legacy": 1, "video_url": 1}
+    level = await db.levels.find_one({"name": exact_name(name)}, fields)
+    if not level:
+        # Offer close names instead of an empty answer
+        suggestions = await db.levels.find(
+            {"name": {"$regex": re.escape(name.strip()), "$options": "i"}}, {"name": 1}
+        ).limit(5).to_list(length=5)
+        return {"level": None, "suggestions": [s['name'] for s in suggestions]}
+    victors = await db.records.count_documents({"level_id": level['_id'], "status": "approved", "progress": 100})
+    return {"level": level, "victors": victors}
+
+async def load_player(name):
+    db = get_db()
+    fields = {"username": 1, "points": 1}
+    user = await db.users.find_one({"username": name.strip()}, fields)
+    if not user:
+        user = await db.users.find_one({"username": exact_name(name)}, fields)
+    if not user:
+        return None
+    points = user.get('points', 0)
+    rank = await db.users.count_documents({"points": {"$gt": points}}) + 1
+    records = await db.records.find(
+        {"user_id": user['_id'], "status": "approved"}, {"level_id": 1, "progress": 1}
+    ).to_list(length=None)
+    completed = [r['level_id'] for r in records if r.get('progress') == 100]
+    hardest = None
+    if completed:
+        hardest = await db.levels.find_one(
+            {"_id": {"$in": completed}, "is_legacy": False}, {"name": 1, "position": 1},
+            sort=[("position", 1)]
         )
-        
-        # Add footer
-        embed.set_footer(text="RTL Admin Notification System")
-        
-        # Send the notification
-        await channel.send(embed=embed)
-        print(f"✅ Sent Discord notification for record by {record_data.get('username')}")
-        
+    return {"user": user, "rank": rank, "records": len(records), "completions": len(completed), "hardest": hardest}
+
+async def load_pending(limit=5):
+    db = get_db()
+    count = await db.records.count_documents({"status": "pending"})
+    oldest = await db.records.aggregate([
+        {"$match": {"status": "pending"}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+        {"$lookup": {"from": "levels", "localField": "level_id", "foreignField": "_id", "as": "level"}},
+        {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "_id", "as": "user"}},
+        {"$project": {"progress": 1, "date_submitted": 1,
+                      "level_name": {"$first": "$level.name"}, "username": {"$first": "$user.username"}}},
+    ])
+    return {"count": count, "oldest": await oldest.to_list(length=limit)}
+
+async def reply_db_error(ctx, e):
+    log.error("Error running !rtl %s: %s", ctx.command, e)
+    await ctx.send("❌ Couldn't reach the database, try again in a moment.")
+
+@bot.command(name='top')
+@commands.cooldown(3, 10, commands.BucketType.user)
+async def top(ctx):
+    """Show the top 10 levels of the main list"""
+    try:
+        levels = await cache.get('top', CACHE_TTLS['top'], load_top)
+    except Exception as e:
+        return await reply_db_error(ctx, e)
+
+    lines = [f"**#{level['position']}** [{level['name']}]({WEBSITE_URL}/level/{level['_id']}) "
+             f"by {level.get('creator', '?')} · {level.get('points', 0)} pts"
+             for level in levels]
+    embed = discord.Embed(title="🏆 RTL Top 10", description="\n".join(lines) or "The list is empty.",
+                          color=0xf59e0b)
+    await ctx.send(embed=embed)
+
+@bot.command(name='level')
+@commands.cooldown(3, 10, commands.BucketType.user)
+async def level(ctx, *, name: str):
+    """Look up a level by name"""
+    key = ('level', name.strip().lower())
+    try:
+        result = await cache.get(key, CACHE_TTLS['level'], lambda: load_level(name))
     except Exception as e:
-        print(f"❌ Error sending Discord notification: {e}")
+        return await reply_db_error(ctx, e)
+
+    level = result['level']
+    if not level:
+        hint = ""
+        if result['suggestions']:
+            hint = " Did you mean: " + ", ".join(f"**{s}**" for s in result['suggestions']) + "?"
+        return await ctx.send(f"❌ No level called **{name}**.{hint}")
+
+    where = "Legacy list" if level.get('is_legacy') else "Main list"
+    embed = discord.Embed(title=f"#{level['position']} {level['name']}",
+                          url=f"{WEBSITE_URL}/level/{level['_id']}", color=0x3b82f6)
+    embed.add_field(name="Creator", value=level.get('creator') or "?", inline=True)
+    embed.add_field(name="Verifier", value=level.get('verifier') or "?", inline=True)
+    embed.add_field(name="List", value=where, inline=True)
+    embed.add_field(name="Points", value=level.get('points', 0), inline=True)
+    embed.add_field(name="Difficulty", value=level.get('difficulty', '?'), inline=True)
+    embed.add_field(name="Victors", value=result['victors'], inline=True)
+    if level.get('video_url'):
+        embed.add_field(name="Verification", value=level['video_url'], inline=False)
+    await ctx.send(embed=embed)
+
+@bot.command(name='player')
+@commands.cooldown(3, 10, commands.BucketType.user)
+async def player(ctx, *, name: str):
+    """Show a player's points, rank and records"""
+    key = ('player', name.strip().lower())
+    try:
+        result = await cache.get(key, CACHE_TTLS['player'], lambda: load_player(name))
+    except Exception as e:
+        return await reply_db_error(ctx, e)
+
+    if not result:
+        return await ctx.send(f"❌ No player called **{name}**.")
+
+    user = result['user']
+    embed = discord.Embed(title=f"👤 {user['username']}", color=0x10b981)
+    embed.add_field(name="Points", value=f"{user.get('points', 0):.2f}", inline=True)
+    embed.add_field(name="Rank", value=f"#{result['rank']}", inline=True)
+    embed.add_field(name="Records", value=f"{result['records']} ({result['completions']} completions)", inline=True)
+    if result['hardest']:
+        hardest = result['hardest']
+        embed.add_field(name="Hardest", value=f"#{hardest['position']} {hardest['name']}", inline=False)
+    await ctx.send(embed=embed)
+
+@bot.command(name='pending')
+@commands.cooldown(3, 10, commands.BucketType.user)
+async def pending(ctx):
+    """Show the record review queue (admin channel only)"""
+    if ADMIN_CHANNEL_ID and ctx.channel.id != ADMIN_CHANNEL_ID:
+        return await ctx.send("❌ This command only works in the admin channel.")
+    try:
+        result = await cache.get('pending', CACHE_TTLS['pending'], load_pending)
+    except Exception as e:
+        return await reply_db_error(ctx, e)
+
+    lines = [f"• {r.get('username') or '?'} — {r.get('level_name') or '?'} ({r.get('progress')}%)"
+             for r in result['oldest']]
+    embed = discord.Embed(title=f"📋 {result['count']} pending record(s)",
+                          description="\n".join(lines) or "Nothing to review 🎉",
+                          url=f"{WEBSITE_URL}/admin", color=0xf59e0b)
+    if lines:
+        embed.set_footer(text="Oldest submissions first")
+    await ctx.send(embed=embed)
+
+@bot.before_invoke
+async def tag_command(ctx):
+    # Each command runs in its own task, so its log records share this ID
+    begin_request(f"cmd-{ctx.message.id}")
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        await ctx.send(f"⏳ Slow down, try again in {error.retry_after:.0f}s.", delete_after=5)
+    elif isinstance(error, commands.MissingRequiredArgument):
+        await ctx.send(f"❌ Usage: `!rtl {ctx.command} <name>`")
+    elif not isinstance(error, commands.CommandNotFound):
+        log.error("Command error in !rtl %s", ctx.command, exc_info=error)
+
+async def send_embeds(embeds):
+    """Post embed dicts to the admin channel, 10 per message; one success flag per embed"""
+    if not ADMIN_CHANNEL_ID:
+        log.warning("No admin channel ID configured")
+        return [False] * len(embeds)
+
+    channel = bot.get_channel(ADMIN_CHANNEL_ID)
+    if not channel:
+        log.warning("Could not find channel with ID %s", ADMIN_CHANNEL_ID)
+        return [False] * len(embeds)
+
+    results = []
+    # discord.py waits out Discord's rate limits itself; stop well inside the outbox lease
+    deadline = time.monotonic() + SEND_BUDGET
+    for chunk in chunk_embeds(embeds):
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(channel.send(embeds=[discord.Embed.from_dict(embed) for embed in chunk]), remaining)
+            sent = True
+        except asyncio.TimeoutError:
+            log.warning("Discord send budget used up, will retry later")
+            sent = False
+        except discord.HTTPException as e:
+            log.warning("Error sending Discord notification: %s", e)
+            sent = False
+        results.extend([sent] * len(chunk))
+    return results
+
+async def send_record_notification(record_data):
+    """Send notification when a new record is submitted"""
+    return (await send_embeds([record_submitted_embed(record_data)]))[0]
 
 async def send_record_approved_notification(record_data):
     """Send notification when a record is approved"""
-    if not ADMIN_CHANNEL_ID:
-        return
-    
-    try:
-        channel = bot.get_channel(ADMIN_CHANNEL_ID)
-        if not channel:
+    return (await send_embeds([record_approved_embed(record_data)]))[0]
+
+def get_db():
+    """Async database handle, created on the bot's event loop"""
+    global _mongo_client
+    if _mongo_client is None:
+        # Same TLS settings as the web app's client (database.get_client)
+        _mongo_client = AsyncMongoClient(MONGODB_URI, **client_options(serverSelectionTimeoutMS=30000))
+    return _mongo_client[MONGODB_DB]
+
+async def drain_outbox(db):
+    """Claim and deliver every due outbox message, in batches"""
+    await db.notification_outbox.update_many(
+        outbox.expired_lease_filter(datetime.now(timezone.utc)),
+        {"$set": {"status": "pending"}}
+    )
+    while True:
+        messages = []
+        while len(messages) < outbox.OUTBOX_BATCH_SIZE:
+            now = datetime.now(timezone.utc)
+            message = await db.notification_outbox.find_one_and_update(
+                outbox.due_filter(now),
+                outbox.claim_update(now),
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not message:
+                break
+            messages.append(message)
+        if not messages:
             return
-        
-        embed = discord.Embed(
-            title="✅ Record Approved",
-            description="A record has been approved and added to the leaderboard",
-            color=0x10b981,  # Green color
-            timestamp=datetime.utcnow()
-        )
-        
-        embed.add_field(
-            name="👤 Player", 
-            value=record_data.get('username', 'Unknown'), 
-            inline=True
-        )
-        embed.add_field(
-            name="🎮 Level", 
-            value=record_data.get('level_name', 'Unknown'), 
-            inline=True
-        )
-        embed.add_field(
-            name="📊 Progress", 
-            value=f"{record_data.get('progress', 0)}%", 
-            inline=True
+
+        embeds, covers = build_embeds([(m['kind'], m['payload']) for m in messages])
+        delivered = [False] * len(messages)
+        for sent, indexes in zip(await send_embeds(embeds), covers):
+            for index in indexes:
+                delivered[index] = sent
+
+        now = datetime.now(timezone.utc)
+        for message, sent in zip(messages, delivered):
+            error = None if sent else "Discord bot could not deliver"
+            await db.notification_outbox.update_one(outbox.finish_filter(message), outbox.finish_update(message, error, now))
+        log.info("Delivered outbox notifications", extra={"delivered": sum(delivered), "claimed": len(messages)})
+
+async def watch_outbox(db):
+    """Follow inserts into the outbox with a change stream, resuming where the last run stopped"""
+    state = await db.bot_state.find_one({"_id": OUTBOX_STREAM_STATE}) or {}
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    try:
+        stream = await db.notification_outbox.watch(
+            pipeline, resume_after=state.get("resume_token"),
+            max_await_time_ms=int(outbox.OUTBOX_POLL_INTERVAL * 1000)
         )
-        embed.add_field(
-            name="🏆 Points Earned", 
-            value=f"{record_data.get('points_earned', 0)} pts", 
-            inline=True
+    except OperationFailure as e:
+        if e.code != CHANGE_STREAM_HISTORY_LOST or not state.get("resume_token"):
+            raise
+        # The oplog no longer holds our position; the backlog is drained from the collection anyway
+        await db.bot_state.delete_one({"_id": OUTBOX_STREAM_STATE})
+        stream = await db.notification_outbox.watch(
+            pipeline, max_await_time_ms=int(outbox.OUTBOX_POLL_INTERVAL * 1000)
         )
-        
-        embed.set_footer(text="RTL Admin Notification System")
-        
-        await channel.send(embed=embed)
-        print(f"✅ Sent approval notification for {record_data.get('username')}")
-        
-    except Exception as e:
-        print(f"❌ Error sending approval notification: {e}")
+
+    async with stream:
+        while not bot.is_closed():
+            change = await stream.try_next()
+            # Empty polls still drain, so retries that come due are picked up
+            await drain_outbox(db)
+            if change is not None:
+                await db.bot_state.update_one(
+                    {"_id": OUTBOX_STREAM_STATE},
+                    {"$set": {"resume_token": stream.resume_token, "updated_at": datetime.now(timezone.utc)}},
+                    upsert=True
+                )
+
+async def consume_outbox():
+    """Deliver web app notifications from the database, with no HTTP hop"""
+    await bot.wait_until_ready()
+    db = get_db()
+    log.info("Consuming notification outbox")
+    while not bot.is_closed():
+        try:
+            await drain_outbox(db)
+            await watch_outbox(db)
+        except OperationFailure as e:
+            # Change streams need a replica set; poll instead on a standalone server
+            if e.code not in CHANGE_STREAMS_UNSUPPORTED:
+                log.error("Outbox change stream error: %s", e)
+            await asyncio.sleep(outbox.OUTBOX_POLL_INTERVAL)
+        except Exception:
+            log.exception("Outbox consumer error")
+            await asyncio.sleep(outbox.OUTBOX_POLL_INTERVAL)
+
+async def setup_hook():
+    if NOTIFICATION_TRANSPORT == 'bot':
+        asyncio.create_task(consume_outbox())
+
+bot.setup_hook = setup_hook
 
 # Global variable to store the bot instance for external access
 _bot_instance = None
@@ -181,24 +456,25 @@ async def start_bot():
     _bot_instance = bot
     
     if not DISCORD_TOKEN:
-        print("❌ No Discord bot token found. Please set DISCORD_BOT_TOKEN in .env")
+        log.error("No Discord bot token found. Please set DISCORD_BOT_TOKEN in .env")
         return
     
     try:
         await bot.start(DISCORD_TOKEN)
-    except Exception as e:
-        print(f"❌ Error starting Discord bot: {e}")
+    except Exception:
+        log.exception("Error starting Discord bot")
 
 def run_bot():
     """Run the Discord bot (blocking)"""
     if not DISCORD_TOKEN:
-        print("❌ No Discord bot token found. Please set DISCORD_BOT_TOKEN in .env")
+        log.error("No Discord bot token found. Please set DISCORD_BOT_TOKEN in .env")
         return
     
     try:
-        bot.run(DISCORD_TOKEN)
-    except Exception as e:
-        print(f"❌ Error running Discord bot: {e}")
+        # log_handler=None: discord.py logs through the root logger set up above
+        bot.run(DISCORD_TOKEN, log_handler=None)
+    except Exception:
+        log.exception("Error running Discord bot")
 
 if __name__ == "__main__":
     run_bot()
\ No newline at end of file
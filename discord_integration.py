@@ -1,199 +1,482 @@
 #!/usr/bin/env python3
 """
 Discord integration for Flask app
-Sends notifications without blocking the main app
+The notify_* functions post synchronously and return True on success;
+main.py calls them from the notification outbox worker, never from a request.
+
+Webhook calls go through a token bucket fed by Discord's X-RateLimit-*
+headers, carry up to 10 embeds each, and bursts of the same kind of
+notification are folded into a single digest embed (submissions grouped
+by level).
 """
 
-import requests
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import json
 from datetime import datetime
 
+import http_client
+from notification_outbox import LEASE_SECONDS, is_digest_kind
+
 # Load environment variables
 load_dotenv()
 
 DISCORD_WEBHOOK_URL = os.environ.get('DISCORD_WEBHOOK_URL')
 
-class DiscordNotifier:
-    """Discord notification handler using webhooks (non-blocking)"""
-    
-    def __init__(self):
-        self.webhook_url = DISCORD_WEBHOOK_URL
-        
-    def send_webhook(self, embed_data):
-        """Send webhook notification to Discord"""
-        if not self.webhook_url:
-            print("❌ No Discord webhook URL configured")
-            return False
-            
-        print(f"🔔 Sending Discord webhook to: {self.webhook_url[:50]}...")
-        print(f"📝 Embed title: {embed_data.get('title', 'No title')}")
-            
-        try:
-            payload = {
-                "embeds": [embed_data]
-            }
-            
-            response = requests.post(
-                self.webhook_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=10
-            )
-            
-            print(f"📡 Discord API response: {response.status_code}")
-            
-            if response.status_code == 204:
-                print("✅ Discord notification sent successfully")
-                return True
-            else:
-                print(f"❌ Discord webhook failed with status {response.status_code}")
-                print(f"Response text: {response.text}")
+log = logging.getLogger('rtl.discord')
+
+# Discord's limits for a single webhook message
+EMBEDS_PER_MESSAGE = 10
+CHARS_PER_MESSAGE = 6000
+DESCRIPTION_LIMIT = 4096
+
+# More than this many notifications of one kind in a batch become a digest
+COALESCE_THRESHOLD = int(os.environ.get('DISCORD_COALESCE_THRESHOLD', '3'))
+
+# How long a send may wait for the rate limit before giving up (the outbox retries later)
+MAX_RATE_LIMIT_WAIT = float(os.environ.get('DISCORD_MAX_RATE_LIMIT_WAIT', '30'))
+MAX_429_RETRIES = 3
+# Total time one send (every chunk, rate-limit wait and 429 retry) may take. It has to
+# end well inside the outbox lease, or another worker re-claims the messages and sends them twice
+SEND_BUDGET = LEASE_SECONDS / 2
+
+
+class RateLimitBucket:
+    """Token bucket for one webhook
+
+    Starts from Discord's usual webhook limit (5 requests per 2 seconds) and
+    is corrected by the X-RateLimit-Remaining / X-RateLimit-Reset-After
+    headers of every response and the retry_after of a 429.
+    """
+
+    def __init__(self, limit=5, per=2.0):
+        self.limit = limit
+        self.per = per
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.per)
+        self.updated = now
+
+    def acquire(self, max_wait=MAX_RATE_LIMIT_WAIT):
+        """Take a token, sleeping if needed; False if that would take longer than max_wait"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.blocked_until - now, (1 - self.tokens) * self.per / self.limit)
+            if now + wait > deadline:
                 return False
-                        
-        except Exception as e:
-            print(f"❌ Error sending Discord webhook: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
-    
-    def send_record_notification(self, record_data):
-        """Send notification for new record submission (non-blocking)"""
-        embed = {
-            "title": "📝 New Record Submission",
-            "description": "A new record has been submitted for review",
-            "color": 16766020,  # Yellow color (0xfbbf24)
-            "timestamp": datetime.utcnow().isoformat(),
-            "fields": [
-                {
-                    "name": "👤 Player",
-                    "value": record_data.get('username', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "🎮 Level",
-                    "value": record_data.get('level_name', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "📊 Progress",
-                    "value": f"{record_data.get('progress', 0)}%",
-                    "inline": True
-                }
-            ],
-            "footer": {
-                "text": "RTL Admin Notification System"
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Sync with the limits Discord reports on a response"""
+        with self.lock:
+            now = time.monotonic()
+            if headers.get('X-RateLimit-Limit'):
+                self.limit = max(int(headers['X-RateLimit-Limit']), 1)
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset_after = headers.get('X-RateLimit-Reset-After')
+            if remaining is not None:
+                self.tokens = float(remaining)
+                self.updated = now
+                if int(remaining) == 0 and reset_after:
+                    self.blocked_until = max(self.blocked_until, now + float(reset_after))
+
+    def block(self, seconds):
+        """Stop sending for a while (after a 429)"""
+        with self.lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+            self.blocked_until = max(self.blocked_until, self.updated + seconds)
+
+
+def embed_size(embed):
+    """Characters Discord counts towards the 6000 per message limit"""
+    size = len(embed.get('title', '')) + len(embed.get('description', ''))
+    size += len(embed.get('footer', {}).get('text', ''))
+    for field in embed.get('fields', []):
+        size += len(field.get('name', '')) + len(field.get('value', ''))
+    return size
+
+
+def chunk_embeds(embeds):
+    """Split embeds into webhook messages of at most 10 embeds / 6000 characters"""
+    chunk, chunk_size = [], 0
+    for embed in embeds:
+        size = embed_size(embed)
+        if chunk and (len(chunk) >= EMBEDS_PER_MESSAGE or chunk_size + size > CHARS_PER_MESSAGE):
+            yield chunk
+            chunk, chunk_size = [], 0
+        chunk.append(embed)
+        chunk_size += size
+    if chunk:
+        yield chunk
+
+
+def admin_panel_field():
+    website_url = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
+    return {
+        "name": "⚙️ Admin Panel",
+        "value": f"[Review Submission]({website_url}/admin)",
+        "inline": False
+    }
+
+
+def record_submitted_embed(record_data):
+    embed = {
+        "title": "📝 New Record Submission",
+        "description": "A new record has been submitted for review",
+        "color": 16766020,  # Yellow color (0xfbbf24)
+        "timestamp": datetime.utcnow().isoformat(),
+        "fields": [
+            {
+                "name": "👤 Player",
+                "value": record_data.get('username', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "🎮 Level",
+                "value": record_data.get('level_name', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "📊 Progress",
+                "value": f"{record_data.get('progress', 0)}%",
+                "inline": True
             }
+        ],
+        "footer": {
+            "text": "RTL Admin Notification System"
         }
-        
-        # Add video link if available
-        if record_data.get('video_url'):
-            embed["fields"].append({
-                "name": "🎥 Video",
-                "value": f"[Watch Video]({record_data['video_url']})",
-                "inline": False
-            })
-        
-        # Add admin panel link
-        website_url = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
+    }
+
+    # Add video link if available
+    if record_data.get('video_url'):
         embed["fields"].append({
-            "name": "⚙️ Admin Panel",
-            "value": f"[Review Submission]({website_url}/admin)",
+            "name": "🎥 Video",
+            "value": f"[Watch Video]({record_data['video_url']})",
             "inline": False
         })
-        
-        # Send webhook directly (no async needed)
-        try:
-            self.send_webhook(embed)
-        except Exception as e:
-            print(f"❌ Error in Discord notification: {e}")
-    
-    def send_record_approved_notification(self, record_data):
-        """Send notification for approved record (non-blocking)"""
+
+    embed["fields"].append(admin_panel_field())
+    return embed
+
+
+def record_approved_embed(record_data):
+    return {
+        "title": "✅ Record Approved",
+        "description": "A record has been approved and added to the leaderboard",
+        "color": 1096065,  # Green color (0x10b981)
+        "timestamp": datetime.utcnow().isoformat(),
+        "fields": [
+            {
+                "name": "👤 Player",
+                "value": record_data.get('username', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "🎮 Level",
+                "value": record_data.get('level_name', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "📊 Progress",
+                "value": f"{record_data.get('progress', 0)}%",
+                "inline": True
+            },
+            {
+                "name": "🏆 Points Earned",
+                "value": f"{record_data.get('points_earned', 0)} pts",
+                "inline": True
+            }
+        ],
+        "footer": {
+            "text": "RTL Admin Notification System"
+        }
+    }
+
+
+def record_rejected_embed(record_data):
+    embed = {
+        "title": "❌ Record Rejected",
+        "description": "A record submission has been rejected",
+        "color": 15548997,  # Red color (0xef4444)
+        "timestamp": datetime.utcnow().isoformat(),
+        "fields": [
+            {
+                "name": "👤 Player",
+                "value": record_data.get('username', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "🎮 Level",
+                "value": record_data.get('level_name', 'Unknown'),
+                "inline": True
+            },
+            {
+                "name": "📊 Progress",
+                "value": f"{record_data.get('progress', 0)}%",
+                "inline": True
+            }
+        ],
+        "footer": {
+            "text": "RTL Admin Notification System"
+        }
+    }
+
+    if record_data.get('reason'):
+        embed["fields"].append({
+            "name": "📝 Reason",
+            "value": record_data['reason'],
+            "inline": False
+        })
+    return embed
+
+
+def _submitted_line(data):
+    line = f"**{data.get('username', 'Unknown')}** - {data.get('level_name', 'Unknown')} ({data.get('progress', 0)}%)"
+    if data.get('video_url'):
+        line += f" [video]({data['video_url']})"
+    return line
+
+
+# notification kind -> (single embed builder, digest title, digest colour, digest line)
+NOTIFICATION_KINDS = {
+    'record_submitted': (record_submitted_embed, "📝 {count} New Record Submissions", 16766020, _submitted_line),
+    'record_approved': (record_approved_embed, "✅ {count} Records Approved", 1096065,
+                        lambda data: f"**{data.get('username', 'Unknown')}** - {data.get('level_name', 'Unknown')} "
+                                     f"({data.get('progress', 0)}%, {data.get('points_earned', 0)} pts)"),
+    'record_rejected': (record_rejected_embed, "❌ {count} Records Rejected", 15548997,
+                        lambda data: f"**{data.get('username', 'Unknown')}** - {data.get('level_name', 'Unknown')} "
+                                     f"({data.get('progress', 0)}%)"),
+}
+
+
+def level_link(data):
+    name = data.get('level_name', 'Unknown')
+    if data.get('level_id') is None:
+        return f"**{name}**"
+    website_url = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
+    return f"**[{name}]({website_url}/level/{data['level_id']})**"
+
+
+def _submitted_entry(data):
+    entry = f"• {data.get('username', 'Unknown')} - {data.get('progress', 0)}%"
+    if data.get('video_url'):
+        entry += f" [video]({data['video_url']})"
+    return entry
+
+
+def digest_groups(kind, payloads):
+    """[(header or None, [(line, position in payloads)])] for a digest
+
+    Submissions are grouped by level, busiest level first; other kinds are
+    one line per notification.
+    """
+    if kind != 'record_submitted':
+        line = NOTIFICATION_KINDS[kind][3]
+        return [(None, [(line(data), position) for position, data in enumerate(payloads)])]
+
+    by_level = {}
+    for position, data in enumerate(payloads):
+        by_level.setdefault(data.get('level_name', 'Unknown'), []).append(position)
+    groups = []
+    for positions in sorted(by_level.values(), key=len, reverse=True):
+        count = len(positions)
+        header = f"{level_link(payloads[positions[0]])} · {count} submission{'s' if count != 1 else ''}"
+        groups.append((header, [(_submitted_entry(payloads[p]), p) for p in positions]))
+    return groups
+
+
+def digest_embeds(kind, payloads):
+    """One or more digest embeds summarising many notifications of a kind
+
+    Returns a list of (embed, positions in payloads that it covers).
+    """
+    _, title, color, _ = NOTIFICATION_KINDS[kind]
+    chunks = [([], [])]  # (description lines, positions)
+    length = 0
+    for header, entries in digest_groups(kind, payloads):
+        for i, (text, position) in enumerate(entries):
+            block = [text] if header is None or i else [header, text]
+            size = sum(len(t) + 1 for t in block)
+            if chunks[-1][1] and length + size > DESCRIPTION_LIMIT:
+                chunks.append(([], []))
+                length = 0
+                if header is not None and i:
+                    block = [f"{header} (continued)", text]
+                    size = sum(len(t) + 1 for t in block)
+            chunks[-1][0].extend(block)
+            chunks[-1][1].append(position)
+            length += size
+
+    result = []
+    for lines, positions in chunks:
         embed = {
-            "title": "✅ Record Approved",
-            "description": "A record has been approved and added to the leaderboard",
-            "color": 1096065,  # Green color (0x10b981)
+            "title": title.format(count=len(positions)),
+            "description": "\n".join(lines),
+            "color": color,
             "timestamp": datetime.utcnow().isoformat(),
-            "fields": [
-                {
-                    "name": "👤 Player",
-                    "value": record_data.get('username', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "🎮 Level",
-                    "value": record_data.get('level_name', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "📊 Progress",
-                    "value": f"{record_data.get('progress', 0)}%",
-                    "inline": True
-                },
-                {
-                    "name": "🏆 Points Earned",
-                    "value": f"{record_data.get('points_earned', 0)} pts",
-                    "inline": True
-                }
-            ],
-            "footer": {
-                "text": "RTL Admin Notification System"
-            }
+            "fields": [],
+            "footer": {"text": "RTL Admin Notification System"}
         }
-        
-        # Send webhook directly (no async needed)
+        if kind == 'record_submitted':
+            embed["fields"].append(admin_panel_field())
+        result.append((embed, positions))
+    return result
+
+
+def build_embeds(notifications):
+    """Embeds for a batch of (kind, payload) notifications
+
+    Kinds with more than COALESCE_THRESHOLD entries, and digest-mode kinds
+    with more than one, are folded into digest embeds. Returns
+    (embeds, covers) where covers[i] lists the indexes of the notifications
+    that embeds[i] delivers.
+    """
+    by_kind = {}
+    for index, (kind, payload) in enumerate(notifications):
+        by_kind.setdefault(kind, []).append(index)
+
+    embeds, covers = [], []
+    for kind, indexes in by_kind.items():
+        if kind not in NOTIFICATION_KINDS:
+            log.warning("Unknown Discord notification kind: %s", kind)
+            continue
+        payloads = [notifications[i][1] for i in indexes]
+        if len(indexes) > COALESCE_THRESHOLD or (is_digest_kind(kind) and len(indexes) > 1):
+            for embed, positions in digest_embeds(kind, payloads):
+                embeds.append(embed)
+                covers.append([indexes[p] for p in positions])
+        else:
+            build = NOTIFICATION_KINDS[kind][0]
+            for index, payload in zip(indexes, payloads):
+                embeds.append(build(payload))
+                covers.append([index])
+    return embeds, covers
+
+
+class DiscordNotifier:
+    """Discord notification handler using webhooks"""
+
+    def __init__(self, webhook_url=None):
+        self.webhook_url = webhook_url or DISCORD_WEBHOOK_URL
+        self.bucket = RateLimitBucket()
+
+    def post_embeds(self, embeds, deadline=None):
+        """Send one webhook message (at most 10 embeds), honouring rate limits
+
+        deadline (time.monotonic()) bounds the rate-limit waits; past it the
+        message is given up and left for the outbox to retry.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + SEND_BUDGET
+        for attempt in range(MAX_429_RETRIES + 1):
+            max_wait = min(MAX_RATE_LIMIT_WAIT, deadline - time.monotonic())
+            if max_wait < 0 or not self.bucket.acquire(max_wait):
+                log.warning("Discord rate limit wait too long, will retry later")
+                return False
+
+            response = http_client.post(
+                self.webhook_url,
+                json={"embeds": embeds},
+                headers={"Content-Type": "application/json"}
+            )
+            self.bucket.update(response.headers)
+
+            if response.status_code == 429:
+                try:
+                    retry_after = float(response.json().get('retry_after', 1))
+                except ValueError:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                log.info("Discord rate limited, retrying in %.2fs", retry_after)
+                self.bucket.block(retry_after)
+                continue
+
+            if response.status_code in (200, 204):
+                return True
+            log.warning("Discord webhook failed with status %s: %s", response.status_code, response.text[:500])
+            return False
+        return False
+
+    def send_embeds(self, embeds):
+        """Send any number of embeds; returns one success flag per embed"""
+        if not self.webhook_url:
+            log.warning("No Discord webhook URL configured")
+            return [False] * len(embeds)
+
+        results = []
+        deadline = time.monotonic() + SEND_BUDGET
+        for chunk in chunk_embeds(embeds):
+            try:
+                sent = self.post_embeds(chunk, deadline)
+            except Exception:
+                log.exception("Error sending Discord webhook")
+                sent = False
+            results.extend([sent] * len(chunk))
+        log.info("Discord embeds sent", extra={"sent": sum(results), "embeds": len(embeds)})
+        return results
+
+    def send_webhook(self, embed_data):
+        """Send a single embed to Discord"""
+        log.debug("Sending Discord webhook: %s", embed_data.get('title', 'No title'))
+        return self.send_embeds([embed_data])[0]
+
+    def send_notifications(self, notifications):
+        """Deliver a batch of (kind, payload) notifications
+
+        Kinds with more than COALESCE_THRESHOLD entries are folded into
+        digest embeds. Returns one success flag per notification.
+        """
+        embeds, covers = build_embeds(notifications)
+        results = [False] * len(notifications)
+        for sent, indexes in zip(self.send_embeds(embeds), covers):
+            for index in indexes:
+                results[index] = sent
+        return results
+
+    def send_record_notification(self, record_data):
+        """Send notification for new record submission"""
+        try:
+            return self.send_webhook(record_submitted_embed(record_data))
+        except Exception:
+            log.exception("Error in Discord notification")
+            return False
+
+    def send_record_approved_notification(self, record_data):
+        """Send notification for approved record"""
         try:
-            self.send_webhook(embed)
-        except Exception as e:
-            print(f"❌ Error in Discord approval notification: {e}")
-    
+            return self.send_webhook(record_approved_embed(record_data))
+        except Exception:
+            log.exception("Error in Discord approval notification")
+            return False
+
     def send_record_rejected_notification(self, record_data, reason=None):
         """Send notification for rejected record"""
-        embed = {
-            "title": "❌ Record Rejected",
-            "description": "A record submission has been rejected",
-            "color": 15548997,  # Red color (0xef4444)
-            "timestamp": datetime.utcnow().isoformat(),
-            "fields": [
-                {
-                    "name": "👤 Player",
-                    "value": record_data.get('username', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "🎮 Level",
-                    "value": record_data.get('level_name', 'Unknown'),
-                    "inline": True
-                },
-                {
-                    "name": "📊 Progress",
-                    "value": f"{record_data.get('progress', 0)}%",
-                    "inline": True
-                }
-            ],
-            "footer": {
-                "text": "RTL Admin Notification System"
-            }
-        }
-        
-        if reason:
-            embed["fields"].append({
-                "name": "📝 Reason",
-                "value": reason,
-                "inline": False
-            })
-        
-        # Send webhook directly (no async needed)
         try:
-            self.send_webhook(embed)
-        except Exception as e:
-            print(f"❌ Error in Discord rejection notification: {e}")
+            return self.send_webhook(record_rejected_embed(dict(record_data, reason=reason)))
+        except Exception:
+            log.exception("Error in Discord rejection notification")
+            return False
 
 # Global notifier instance
 discord_notifier = DiscordNotifier()
 
+def send_notifications(notifications):
+    """Deliver a batch of (kind, payload) notifications; one success flag each"""
+    return discord_notifier.send_notifications(notifications)
+
 def notify_record_submitted(username, level_name, progress, video_url):
     """Convenience function to notify about new record submission"""
     record_data = {
@@ -202,16 +485,15 @@ def notify_record_submitted(username, level_name, progress, video_url):
         'progress': progress,
         'video_url': video_url
     }
-    
-    print(f"🔔 notify_record_submitted called for {username}")
-    
+
+    log.debug("notify_record_submitted called for %s", username)
+
     # Send directly instead of using threads (more reliable)
     try:
-        discord_notifier.send_record_notification(record_data)
-    except Exception as e:
-        print(f"❌ Error in notify_record_submitted: {e}")
-        import traceback
-        traceback.print_exc()
+        return discord_notifier.send_record_notification(record_data)
+    except Exception:
+        log.exception("Error in notify_record_submitted")
+        return False
 
 def notify_record_approved(username, level_name, progress, points_earned):
     """Convenience function to notify about approved record"""
@@ -221,16 +503,15 @@ def notify_record_approved(username, level_name, progress, points_earned):
         'progress': progress,
         'points_earned': points_earned
     }
-    
-    print(f"🔔 notify_record_approved called for {username}")
-    
+
+    log.debug("notify_record_approved called for %s", username)
+
     # Send directly instead of using threads (more reliable)
     try:
-        discord_notifier.send_record_approved_notification(record_data)
-    except Exception as e:
-        print(f"❌ Error in notify_record_approved: {e}")
-        import traceback
-        traceback.print_exc()
+        return discord_notifier.send_record_approved_notification(record_data)
+    except Exception:
+        log.exception("Error in notify_record_approved")
+        return False
 
 def notify_record_rejected(username, level_name, progress, reason=None):
     """Convenience function to notify about rejected record"""
@@ -239,13 +520,12 @@ def notify_record_rejected(username, level_name, progress, reason=None):
         'level_name': level_name,
         'progress': progress
     }
-    
-    print(f"🔔 notify_record_rejected called for {username}")
-    
+
+    log.debug("notify_record_rejected called for %s", username)
+
     # Send directly instead of using threads (more reliable)
     try:
-        discord_notifier.send_record_rejected_notification(record_data, reason)
-    except Exception as e:
-        print(f"❌ Error in notify_record_rejected: {e}")
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+        return discord_notifier.send_record_rejected_notification(record_data, reason)
+    except Exception:
+        log.exception("Error in notify_record_rejected")
+        return False
@@ -0,0 +1,46 @@
+"""
+Gunicorn settings for production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app) and forked into
+WEB_CONCURRENCY workers. MongoClient, the outbox worker thread and the HTTP
+session do not survive fork(), so each worker creates its own after the
+fork; the master only reconciles indexes and then closes its client.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# More than one thread switches to the gthread worker; each thread can hold a Mongo connection
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+preload_app = True
+accesslog = '-'
+
+
+def when_ready(server):
+    """Runs in the master before any worker is forked"""
+    import database
+    import main
+
+    if main.app.config['DB_INDEXES_ON_STARTUP']:
+        main.reconcile_indexes()
+    # Workers must not inherit a live client
+    database.close_client()
+
+
+def post_fork(server, worker):
+    """Runs in each new worker: start its background threads (indexes were done by the master)"""
+    import main
+
+    main.create_app({'DB_INDEXES_ON_STARTUP': False})
+    server.log.info("Worker %s started its background tasks", worker.pid)
+
+
+def worker_exit(server, worker):
+    import main
+
+    main.outbox_worker.stop()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Health checks
+A daemon thread pings MongoDB every HEALTH_CHECK_INTERVAL seconds and keeps
+the result, so /healthz, /readyz and hot routes can ask whether the
+database is up without a round trip of their own
+"""
+
+import logging
+import os
+import threading
+import time
+
+import pymongo
+
+HEALTH_CHECK_INTERVAL = float(os.environ.get('HEALTH_CHECK_INTERVAL', '10'))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', '2'))
+# A result older than this (the checker stalled) no longer counts as ready
+HEALTH_STALE_AFTER = 3 * HEALTH_CHECK_INTERVAL
+
+log = logging.getLogger('rtl.health')
+
+
+class HealthMonitor:
+    """Cached MongoDB connectivity, refreshed on a daemon thread
+
+    get_client returns the MongoClient to ping; it is called on every check
+    so a client rebuilt after fork is picked up.
+    """
+
+    def __init__(self, get_client, interval=None):
+        self.get_client = get_client
+        self.interval = interval or HEALTH_CHECK_INTERVAL
+        self.started_at = time.time()
+        self.last = None  # (ok, latency_ms, error, checked_at monotonic, checked_at wall)
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def start(self):
+        # Threads do not survive fork(), so a forked worker process starts its own
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self.started_at = time.time()
+        self.last = None
+        self._thread = threading.Thread(target=self._run, name='health-check', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def check(self):
+        """Ping the database now and remember the outcome"""
+        started = time.perf_counter()
+        try:
+            with pymongo.timeout(HEALTH_CHECK_TIMEOUT):
+                self.get_client().admin.command('ping')
+            ok, error = True, None
+        except Exception as e:
+            # Only the type is exposed on /readyz; the message names hosts
+            ok, error = False, type(e).__name__
+            if self.database_ok():
+                log.error("Database health check failed: %s", e)
+        else:
+            if not self.database_ok():
+                log.info("Database reachable again")
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.last = (ok, latency_ms, error, time.monotonic(), time.time())
+        return ok
+
+    def database_ok(self):
+        """False only if the last check failed; True while nothing is known yet"""
+        last = self.last
+        return last is None or last[0]
+
+    def ready(self):
+        """Checked recently and the database answered"""
+        last = self.last
+        return last is not None and last[0] and time.monotonic() - last[3] < HEALTH_STALE_AFTER
+
+    def status(self):
+        last = self.last
+        database = {"checked": last is not None}
+        if last is not None:
+            ok, latency_ms, error, checked_mono, checked_at = last
+            database.update({
+                "ok": ok,
+                "latency_ms": round(latency_ms, 1),
+                "error": error,
+                "checked_at": checked_at,
+                "age_s": round(time.monotonic() - checked_mono, 1),
+            })
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "checker_running": bool(self._thread and self._thread.is_alive() and self._pid == os.getpid()),
+            "database": database,
+        }
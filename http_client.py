@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Shared outbound HTTP client
+One pooled keep-alive requests.Session per process for webhooks and other
+outbound calls, with a bounded connection pool per host, per-host timeouts
+and counters showing how often connections are reused
+
+At most HTTP_POOL_MAXSIZE requests per host are in flight; a caller waits
+at most HTTP_POOL_TIMEOUT seconds for a slot and then gets a
+requests.exceptions.ConnectionError instead of queueing forever.
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+# Connections kept open per host, and the number of hosts with a pool
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '4'))
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', '8'))
+# Longest wait for a free connection to a host
+HTTP_POOL_TIMEOUT = float(os.environ.get('HTTP_POOL_TIMEOUT', '5'))
+
+# host -> (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+HOST_TIMEOUTS = {
+    'discord.com': (3.05, 10),
+    'discordapp.com': (3.05, 10),
+    'img.youtube.com': (3.05, 5),
+}
+
+
+def _parse_timeouts(value):
+    """HTTP_TIMEOUTS="discord.com=3:10,img.youtube.com=2:5" """
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        host, _, pair = item.partition('=')
+        connect, _, read = pair.partition(':')
+        timeouts[host.strip().lower()] = (float(connect), float(read or connect))
+    return timeouts
+
+
+HOST_TIMEOUTS.update(_parse_timeouts(os.environ.get('HTTP_TIMEOUTS', '')))
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+# host -> semaphore with one slot per pooled connection
+_slots = {}
+
+
+def get_session():
+    """The process-wide pooled session (recreated after fork, never shared across processes)"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                # Imported here: requests is a large part of the web app's import time
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                # pool_block keeps the number of open sockets per host bounded under load
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                    pool_block=True,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session, _session_pid = session, os.getpid()
+                _slots.clear()
+    return _session
+
+
+def _host_slots(host):
+    with _lock:
+        slots = _slots.get(host)
+        if slots is None:
+            slots = _slots[host] = threading.BoundedSemaphore(HTTP_POOL_MAXSIZE)
+        return slots
+
+
+def timeout_for(url):
+    host = (urlsplit(url).hostname or '').lower()
+    if host in HOST_TIMEOUTS:
+        return HOST_TIMEOUTS[host]
+    # Subdomains fall back to their parent's timeout (e.g. ptb.discord.com)
+    for known, timeout in HOST_TIMEOUTS.items():
+        if host.endswith('.' + known):
+            return timeout
+    return DEFAULT_TIMEOUT
+
+
+def request(method, url, **kwargs):
+    """requests.request through the shared pool, with the host's timeout by default"""
+    kwargs.setdefault('timeout', timeout_for(url))
+    session = get_session()
+    host = (urlsplit(url).hostname or '').lower()
+    # urllib3's blocking pool would wait without limit when every connection is busy
+    slots = _host_slots(host)
+    if not slots.acquire(timeout=HTTP_POOL_TIMEOUT):
+        import requests
+        raise requests.exceptions.ConnectionError(f"No free connection to {host} within {HTTP_POOL_TIMEOUT}s")
+    try:
+        return session.request(method, url, **kwargs)
+    finally:
+        slots.release()
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def http_metrics():
+    """Per-host connection reuse for this process
+
+    requests is the number of HTTP requests sent, connections the number of
+    TCP (+TLS) connections that had to be opened for them.
+    """
+    session = _session if _session_pid == os.getpid() else None
+    if session is None:
+        return {}
+    metrics = {}
+    for adapter in set(session.adapters.values()):
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            sent = pool.num_requests
+            opened = pool.num_connections
+            metrics[host] = {
+                "requests": sent,
+                "connections": opened,
+                "reused": max(sent - opened, 0),
+                "reuse_ratio": round(max(sent - opened, 0) / sent, 3) if sent else None,
+            }
+    return metrics
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Level history helpers
+Stores only the fields that changed on each admin action, with thumbnails
+referenced by hash and large payloads compressed
+"""
+
+import hashlib
+import os
+import zlib
+from datetime import datetime, timezone
+
+from bson import json_util
+from bson.binary import Binary
+
+# Payloads bigger than this (in bytes of JSON) are zlib-compressed
+COMPRESS_THRESHOLD = int(os.environ.get('HISTORY_COMPRESS_THRESHOLD', '1024'))
+
+# Fields that are never worth recording in a diff
+IGNORED_FIELDS = {'_id', 'date_added'}
+
+
+def _thumbnail_ref(db, value):
+    """Replace an inline data: URI with a reference to a deduplicated blob"""
+    if not isinstance(value, str) or not value.startswith('data:'):
+        return value
+
+    digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+    db.level_history_blobs.update_one(
+        {"_id": digest},
+        {"$setOnInsert": {
+            "data": Binary(zlib.compress(value.encode('utf-8'))),
+            "size": len(value),
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    return {"$thumbnail": digest}
+
+
+def _same(old, new):
+    """Compare two field values, treating 1 and 1.0 as equal"""
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)) \
+            and not isinstance(old, bool) and not isinstance(new, bool):
+        return float(old) == float(new)
+    return old == new
+
+
+def diff_fields(old_data, new_data):
+    """Return {field: [old, new]} for every field in new_data that changed"""
+    changes = {}
+    for field, new_value in new_data.items():
+        if field in IGNORED_FIELDS:
+            continue
+        old_value = old_data.get(field)
+        if not _same(old_value, new_value):
+            changes[field] = [old_value, new_value]
+    return changes
+
+
+def _pack(db, data):
+    """Swap thumbnails for hashes and compress the result if it is large"""
+    packed = {}
+    for field, value in data.items():
+        if field == 'thumbnail_url':
+            if isinstance(value, list):
+                value = [_thumbnail_ref(db, v) for v in value]
+            else:
+                value = _thumbnail_ref(db, value)
+        packed[field] = value
+
+    encoded = json_util.dumps(packed).encode('utf-8')
+    if len(encoded) > COMPRESS_THRESHOLD:
+        return {"encoding": "zlib+json", "payload": Binary(zlib.compress(encoded))}
+    return {"encoding": "plain", "payload": packed}
+
+
+def _unpack(db, entry, resolve_thumbnails):
+    """Inverse of _pack"""
+    if entry.get("encoding") == "zlib+json":
+        data = json_util.loads(zlib.decompress(entry["payload"]).decode('utf-8'))
+    else:
+        data = entry.get("payload", {})
+
+    if not resolve_thumbnails:
+        return data
+
+    def resolve(value):
+        if isinstance(value, dict) and "$thumbnail" in value:
+            blob = db.level_history_blobs.find_one({"_id": value["$thumbnail"]})
+            if not blob:
+                return None
+            # migrate_thumbnails.py moves the image to the thumbnail store
+            if blob.get("thumbnail_hash"):
+                return f"/thumbnails/{blob['thumbnail_hash']}"
+            return zlib.decompress(blob["data"]).decode('utf-8')
+        return value
+
+    if 'thumbnail_url' in data:
+        value = data['thumbnail_url']
+        data['thumbnail_url'] = [resolve(v) for v in value] if isinstance(value, list) else resolve(value)
+    return data
+
+
+def _insert(db, level_id, action, data, **extra):
+    entry = {
+        "level_id": level_id,
+        "action": action,
+        "timestamp": datetime.now(timezone.utc)
+    }
+    entry.update(extra)
+    entry.update(_pack(db, data))
+    db.level_history.insert_one(entry)
+    return entry
+
+
+def record_level_added(db, level):
+    """Record a new level (full snapshot, thumbnail stored by hash)"""
+    snapshot = {k: v for k, v in level.items() if k not in IGNORED_FIELDS}
+    return _insert(db, level['_id'], "added", snapshot)
+
+
+def record_level_updated(db, old_level, update_data):
+    """Record only the fields an edit actually changed"""
+    changes = diff_fields(old_level, update_data)
+    if not changes:
+        return None
+    return _insert(db, old_level['_id'], "updated", changes)
+
+
+def record_level_deleted(db, level):
+    """Record a deleted level so it can be restored later"""
+    snapshot = {k: v for k, v in level.items() if k not in IGNORED_FIELDS}
+    return _insert(db, level['_id'], "deleted", snapshot)
+
+
+def record_position_shift(db, caused_by, is_legacy, start, end, delta):
+    """Record a neighbour shift as a single range entry instead of per level
+
+    Every level on the given list with start <= position <= end (end may be
+    None for "to the bottom of the list") moved by delta.
+    """
+    if start is not None and end is not None and start > end:
+        return None
+    return _insert(db, caused_by, "shifted", {
+        "is_legacy": is_legacy,
+        "start": start,
+        "end": end,
+        "delta": delta
+    })
+
+
+def load_history(db, level_id, resolve_thumbnails=False):
+    """Return decoded history entries for a level, oldest first"""
+    entries = []
+    for entry in db.level_history.find({"level_id": level_id}).sort("timestamp", 1):
+        if "encoding" in entry:
+            entry["data"] = _unpack(db, entry, resolve_thumbnails)
+            entry.pop("payload", None)
+        entries.append(entry)
+    return entries
+
+
+def referenced_thumbnail_hashes(db):
+    """Every thumbnail store hash that some history entry still points at"""
+    hashes = set()
+
+    def collect(value):
+        if isinstance(value, str):
+            hashes.add(value)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    for entry in db.level_history.find({}):
+        if "encoding" in entry:
+            collect(_unpack(db, entry, False).get('thumbnail_hash'))
+        # Entries written before diffs carried whole snapshots
+        for snapshot in ("old_data", "new_data"):
+            collect((entry.get(snapshot) or {}).get('thumbnail_hash'))
+
+    for blob in db.level_history_blobs.find({"thumbnail_hash": {"$exists": True}}, {"thumbnail_hash": 1}):
+        hashes.add(blob['thumbnail_hash'])
+    return hashes
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+In-process read-through cache for the list pages and the JSON API
+Entries expire after a short TTL and are dropped on every admin change.
+ETags come from a revision counter kept in MongoDB plus the ids, positions
+and points of the items, so every worker builds the same one for the same data
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+LIST_CACHE_TTL = float(os.environ.get('LIST_CACHE_TTL', '30'))
+
+
+# Shared revision counter in MongoDB, bumped by every invalidate()
+REVISION_ID = 'list_revision'
+
+# Fields that change when a list is reordered or rescored (also by maintenance scripts)
+VERSION_FIELDS = ('_id', 'position', 'points')
+
+
+def list_version(items, revision):
+    """ETag basis that every worker process computes alike for the same data"""
+    fields = [tuple(item.get(field) for field in VERSION_FIELDS) for item in items]
+    return hashlib.sha1(repr((revision, fields)).encode('utf-8')).hexdigest()
+
+
+class CacheEntry:
+    """A cached list together with the version used to build ETags"""
+
+    def __init__(self, items, revision=0):
+        self.items = items
+        self.version = list_version(items, revision)
+        self.loaded_at = time.monotonic()
+        self._by_id = None
+
+    def by_id(self):
+        """Lazily built {_id: item} lookup"""
+        if self._by_id is None:
+            self._by_id = {item['_id']: item for item in self.items}
+        return self._by_id
+
+
+class ListCache:
+    """Thread-safe TTL cache keyed by list name"""
+
+    def __init__(self, ttl=LIST_CACHE_TTL, db=None):
+        self.ttl = ttl
+        self.db = db
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidate() so loads that started earlier are not stored
+        self._generation = 0
+
+    def bind(self, db):
+        """Share the revision counter through db (gunicorn workers each have their own cache)"""
+        self.db = db
+
+    def _revision(self):
+        if self.db is None:
+            return 0
+        state = self.db.app_state.find_one({"_id": REVISION_ID})
+        return state['value'] if state else 0
+
+    def _store(self, key, items, generation, revision):
+        entry = CacheEntry(items, revision)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+        return entry
+
+    def get(self, key, loader):
+        """Return the cached entry for key, calling loader() on a miss"""
+        entry = self.fresh(key)
+        if entry is not None:
+            return entry
+
+        generation = self._generation
+        revision = self._revision()
+        return self._store(key, loader(), generation, revision)
+
+    def fresh(self, key):
+        """Return the entry for key if it has not expired, else None"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+        return None
+
+    def stream(self, key, cursor_factory):
+        """Yield items one by one, from the cache if warm or lazily from the cursor
+
+        On a miss the cursor is iterated as the caller consumes it and the cache
+        is filled once it has been read to the end.
+        """
+        entry = self.fresh(key)
+        if entry is not None:
+            yield from entry.items
+            return
+
+        generation = self._generation
+        revision = self._revision()
+        items = []
+        for item in cursor_factory():
+            items.append(item)
+            yield item
+        self._store(key, items, generation, revision)
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or everything if no keys are given"""
+        with self._lock:
+            self._generation += 1
+            if keys:
+                for key in keys:
+                    self._entries.pop(key, None)
+            else:
+                self._entries.clear()
+        if self.db is not None:
+            self.db.app_state.update_one({"_id": REVISION_ID}, {"$inc": {"value": 1}}, upsert=True)
+
+
+# Global cache instance shared by the HTML routes and the API
+list_cache = ListCache()
@@ -1,140 +1,132 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from pymongo import MongoClient
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, get_flashed_messages, session, send_file, abort, g
 from werkzeug.security import generate_password_hash, check_password_hash
-from authlib.integrations.flask_client import OAuth
+import logging
 import os
+import threading
 from datetime import datetime, timezone
 
-# Try to import Discord integration, but don't fail if it's missing
-try:
-    from discord_integration import notify_record_submitted, notify_record_approved, notify_record_rejected
-    DISCORD_AVAILABLE = True
-    print("✅ Discord integration loaded successfully")
-except ImportError as e:
-    print(f"❌ Discord integration failed to load: {e}")
-    DISCORD_AVAILABLE = False
-    # Create dummy functions so the app doesn't crash
-    def notify_record_submitted(*args, **kwargs):
-        print("❌ Discord integration not available - notify_record_submitted")
-    def notify_record_approved(*args, **kwargs):
-        print("❌ Discord integration not available - notify_record_approved")  
-    def notify_record_rejected(*args, **kwargs):
-        print("❌ Discord integration not available - notify_record_rejected")
 from dotenv import load_dotenv
+from app_logging import setup_logging, begin_request, end_request, current_request_id
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from database import LazyDatabase, OperationTimeouts, operation_timeout, pool_metrics, OPERATION_TIMEOUTS, get_client
+from health import HealthMonitor
+from level_history import record_level_added, record_level_updated, record_level_deleted, record_position_shift
+from list_cache import list_cache
+from search_index import search_index, INDEX_PROJECTION
+from db_indexes import ensure_indexes
+from thumbnail_store import thumbnail_path, read_thumbnail_type, is_thumbnail_hash
+from thumbnail_log import append_upload
+from thumbnail_dedup import dedupe_upload, add_reference, release_reference
+from thumbnail_upload import validate_upload, ThumbnailRejected, MAX_THUMBNAIL_BYTES
+from thumbnail_variants import schedule_variants, variant_path, variant_fields, FORMATS
+from video_embeds import normalize_video
+import http_client
+from notification_outbox import enqueue as enqueue_notification, OutboxWorker
+from youtube_thumbnails import cached_thumbnail as cached_youtube_thumbnail, is_video_id, YOUTUBE_VARIANTS
 
 # Load environment variables from .env file
 load_dotenv()
+setup_logging()
+log = logging.getLogger('rtl.web')
+request_log = logging.getLogger('rtl.requests')
+
+# Warn when importing main plus create_app() takes longer than this
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', '1500'))
+
+# Requests slower than this are logged as warnings (the rest only at DEBUG)
+LOG_SLOW_REQUEST_MS = float(os.environ.get('LOG_SLOW_REQUEST_MS', '1000'))
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
+# Thumbnail uploads are the largest requests; leave 1 MB for the rest of the form
+app.config['MAX_CONTENT_LENGTH'] = MAX_THUMBNAIL_BYTES + 1024 * 1024
 
-# MongoDB configuration
-mongodb_uri = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
-mongodb_db = os.environ.get('MONGODB_DB', 'rtl_database')
+# Set to false to skip index reconciliation at startup (gunicorn does it once in the master)
+app.config['DB_INDEXES_ON_STARTUP'] = os.environ.get('DB_INDEXES_ON_STARTUP', 'true').lower() != 'false'
+# Set to false to start no background threads at all (scripts and test clients against a real database)
+app.config['BACKGROUND_TASKS'] = os.environ.get('BACKGROUND_TASKS', 'true').lower() != 'false'
 
 # Google OAuth configuration
 app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID')
 app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET')
 
-# Initialize MongoDB and OAuth
-print("Initializing MongoDB connection...")
-try:
-    print(f"MongoDB URI: {mongodb_uri[:50]}...")
-    print(f"MongoDB DB: {mongodb_db}")
-    mongo_client = MongoClient(
-        mongodb_uri,
-        tls=True,
-        tlsAllowInvalidCertificates=True,
-        tlsAllowInvalidHostnames=True,
-        serverSelectionTimeoutMS=2000,
-        socketTimeoutMS=2000,
-        connectTimeoutMS=2000
-    )
-    mongo_db = mongo_client[mongodb_db]
-    # Test connection
-    mongo_client.admin.command('ping')
-    print("✓ MongoDB initialized successfully")
-    # Create indexes for better performance
-    try:
-        mongo_db.levels.create_index([("is_legacy", 1), ("position", 1)])
-        print("✓ Database indexes created")
-    except Exception as e:
-        print(f"Index creation warning: {e}")
-except Exception as e:
-    print(f"MongoDB initialization error: {e}")
-    print("Falling back to SQLite...")
-    # Fall back to SQLite if MongoDB fails
-    import subprocess
-    subprocess.run(['python', 'main_sqlite_backup.py'])
-    exit()
-    
-print("Initializing OAuth...")
-oauth = OAuth(app)
-
-# Configure Google OAuth only if credentials are provided
-print("Configuring Google OAuth...")
-google = None
-if app.config['GOOGLE_CLIENT_ID'] and app.config['GOOGLE_CLIENT_SECRET']:
-    print("Google OAuth credentials found, registering...")
-    google = oauth.register(
-        name='google',
-        client_id=app.config['GOOGLE_CLIENT_ID'],
-        client_secret=app.config['GOOGLE_CLIENT_SECRET'],
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={
-            'scope': 'openid email profile'
-        }
-    )
-    print("✓ Google OAuth configured")
-else:
-    print("No Google OAuth credentials found, skipping...")
-
-# Helper functions
-def get_video_embed_info(video_url):
-    """Extract video platform and embed information from URL"""
-    if not video_url:
-        return None
-    
-    # YouTube support
-    if 'youtube.com' in video_url or 'youtu.be' in video_url:
-        if 'youtube.com' in video_url and 'v=' in video_url:
-            video_id = video_url.split('v=')[1].split('&')[0]
-        elif 'youtu.be' in video_url:
-            video_id = video_url.split('/')[-1].split('?')[0]
-        else:
-            return None
-        return {
-            'platform': 'youtube',
-            'embed_url': f'https://www.youtube.com/embed/{video_id}',
-            'video_id': video_id
-        }
-    
-    # Streamable support
-    elif 'streamable.com' in video_url:
-        video_id = video_url.split('/')[-1]
-        return {
-            'platform': 'streamable',
-            'embed_url': f'https://streamable.com/e/{video_id}',
-            'video_id': video_id
-        }
-    
-    # TikTok support
-    elif 'tiktok.com' in video_url:
-        # Extract video ID from TikTok URL
-        if '/video/' in video_url:
-            video_id = video_url.split('/video/')[1].split('?')[0]
-        else:
-            return None
-        return {
-            'platform': 'tiktok',
-            'embed_url': f'https://www.tiktok.com/embed/v2/{video_id}',
-            'video_id': video_id
-        }
-    
-    return None
+# MongoDB: the client connects on the first query, not at import
+mongo_db = LazyDatabase()
+list_cache.bind(mongo_db)
+# Page reads, admin writes: each request's queries share one deadline (see database.py)
+app.wsgi_app = OperationTimeouts(app.wsgi_app)
+
+@app.before_request
+def start_request_log():
+    g.request_started = time.perf_counter()
+    begin_request(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def finish_request_log(response):
+    response.headers['X-Request-ID'] = current_request_id()
+    elapsed_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+    # Streamed pages are timed up to the first byte
+    level = logging.WARNING if elapsed_ms > LOG_SLOW_REQUEST_MS else logging.DEBUG
+    if request_log.isEnabledFor(level):
+        request_log.log(level, "%s %s %s", request.method, request.path, response.status_code,
+                        extra={"duration_ms": round(elapsed_ms, 1)})
+    return response
+
+@app.teardown_request
+def end_request_log(error=None):
+    end_request()
+
+_google = None
+_google_lock = threading.Lock()
+
+def get_google():
+    """Google OAuth client, registered on the first login (authlib is slow to import); None if not configured"""
+    global _google
+    if _google is None and app.config['GOOGLE_CLIENT_ID'] and app.config['GOOGLE_CLIENT_SECRET']:
+        with _google_lock:
+            if _google is None:
+                from authlib.integrations.flask_client import OAuth
+                _google = OAuth(app).register(
+                    name='google',
+                    client_id=app.config['GOOGLE_CLIENT_ID'],
+                    client_secret=app.config['GOOGLE_CLIENT_SECRET'],
+                    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                    client_kwargs={
+                        'scope': 'openid email profile'
+                    }
+                )
+                log.info("Google OAuth configured")
+    return _google
+
+_discord = None
+DISCORD_AVAILABLE = None  # unknown until the integration is first needed
+
+def load_discord():
+    """The discord_integration module, imported on first use; None if it cannot be loaded"""
+    global _discord, DISCORD_AVAILABLE
+    if DISCORD_AVAILABLE is None:
+        try:
+            import discord_integration
+            _discord = discord_integration
+            DISCORD_AVAILABLE = True
+            log.info("Discord integration loaded")
+        except ImportError as e:
+            log.warning("Discord integration failed to load: %s", e)
+            DISCORD_AVAILABLE = False
+    return _discord
+
+def video_embed_for(doc):
+    """A level's or record's video_embed, parsed from video_url if it was never backfilled"""
+    if isinstance(doc, dict):
+        embed, video_url = doc.get('video_embed'), doc.get('video_url')
+    else:
+        embed, video_url = getattr(doc, 'video_embed', None), getattr(doc, 'video_url', None)
+    return embed if embed is not None else normalize_video(video_url)
 
 # Context processor
 @app.context_processor
@@ -147,8 +139,10 @@ def utility_processor():
     
     return dict(
         format_points=format_points, 
-        get_video_embed_info=get_video_embed_info,
-        current_theme=current_theme
+        current_theme=current_theme,
+        thumbnail_src=thumbnail_src,
+        thumbnail_sources=thumbnail_sources,
+        video_embed_for=video_embed_for
     )
 
 def calculate_level_points(position, is_legacy=False, level_type="Level"):
@@ -188,14 +182,20 @@ def update_user_points(user_id):
         {"_id": user_id},
         {"$set": {"points": total_points}}
     )
+    list_cache.invalidate('players')
     return total_points
 
-def shift_level_positions(position, is_legacy=False, direction=1):
-    """Shift level positions up or down from a given position"""
+def shift_level_positions(position, is_legacy=False, direction=1, end=None, caused_by=None):
+    """Shift level positions up or down from a given position (up to end, inclusive)"""
+    position_query = {"$gte": position}
+    if end is not None:
+        position_query["$lte"] = end
     mongo_db.levels.update_many(
-        {"position": {"$gte": position}, "is_legacy": is_legacy},
+        {"position": position_query, "is_legacy": is_legacy},
         {"$inc": {"position": direction}}
     )
+    if caused_by is not None:
+        record_position_shift(mongo_db, caused_by, is_legacy, position, end, direction)
 
 def recalculate_all_points():
     """Recalculate points for all levels based on their current positions"""
@@ -207,20 +207,120 @@ def recalculate_all_points():
                 {"_id": level['_id']},
                 {"$set": {"points": new_points}}
             )
+    # Every caller has just changed the list, so drop the cached copies
+    list_cache.invalidate('main', 'legacy')
+
+def level_list_cursor(is_legacy):
+    """Lazy cursor over one list, sorted by position"""
+    return mongo_db.levels.find({"is_legacy": is_legacy}).sort("position", 1)
+
+def get_cached_list(name):
+    """Return the cached 'main', 'legacy' or 'players' list (shared with the API)"""
+    if name == 'main':
+        return list_cache.get(name, lambda: list(level_list_cursor(False)))
+    if name == 'legacy':
+        return list_cache.get(name, lambda: list(level_list_cursor(True)))
+    if name == 'players':
+        return list_cache.get(name, lambda: list(mongo_db.users.find(
+            {}, {"username": 1, "points": 1, "date_joined": 1}
+        ).sort([("points", -1), ("_id", 1)])))
+    raise KeyError(name)
+
+def thumbnail_src(level):
+    """URL to show for a level's custom thumbnail, or None"""
+    if level.get('thumbnail_hash'):
+        return url_for('thumbnail', digest=level['thumbnail_hash'])
+    return level.get('thumbnail_url') or None
+
+def thumbnail_sources(level, variant='list'):
+    """{'webp': url, 'jpeg': url} for a resized variant, or None if not generated yet"""
+    digest = level.get('thumbnail_hash')
+    if not digest or variant not in level.get('thumbnail_variants', []):
+        return None
+    return {
+        fmt: url_for('thumbnail_variant', digest=digest, variant=variant, fmt=fmt)
+        for fmt in FORMATS
+    }
+
+def mark_thumbnail_variants(digest, variants):
+    """Called from the resize worker once a thumbnail's variants exist"""
+    mongo_db.levels.update_many(
+        {"thumbnail_hash": digest},
+        {"$set": variant_fields(digest, variants)}
+    )
+    list_cache.invalidate('main', 'legacy')
+
+def parse_thumbnail_field(value):
+    """Split a submitted thumbnail URL into (thumbnail_url, thumbnail_hash)
+
+    Links to our own /thumbnails/<hash> route are stored as the bare hash.
+    """
+    value = (value or '').strip()
+    prefix = '/thumbnails/'
+    if prefix in value:
+        digest = value.split(prefix, 1)[1].split('?')[0]
+        if is_thumbnail_hash(digest):
+            return None, digest
+    return value or None, None
+
+def save_uploaded_thumbnail(file, level_name):
+    """Validate an uploaded thumbnail, store it in the blob store and return its hash
+
+    Re-uploads of an image already in the store (byte-identical, or visually
+    identical with THUMBNAIL_REUSE_SIMILAR) return the existing hash instead
+    of storing another copy; the admin is told about a visual match.
+    Raises ThumbnailRejected if the file is too large or not an image.
+    """
+    file_data, mime_type, original_size = validate_upload(file)
+    digest, match, similar_to = dedupe_upload(file_data)
+    
+    # Append to the upload log (one row, no rewrite of earlier uploads)
+    append_upload(level_name, digest, mime_type=mime_type, filename=file.filename, size=len(file_data))
+    
+    log.info("Thumbnail uploaded", extra={"level_name": level_name, "mime_type": mime_type, "size": len(file_data),
+                                           "original_size": original_size, "hash": digest, "match": match,
+                                           "similar_to": similar_to})
+    if similar_to == digest:
+        flash('This thumbnail looks almost identical to one already stored, so the stored image is used.', 'info')
+    elif similar_to:
+        flash('This thumbnail looks almost identical to one already stored; it was saved as a new image.', 'info')
+    return digest
+
+def search_levels(query, limit=10):
+    """Rank levels for a query using the in-memory search index"""
+    search_index.ensure_built(lambda: mongo_db.levels.find({}, INDEX_PROJECTION))
+    main_levels = get_cached_list('main').by_id()
+    legacy_levels = get_cached_list('legacy').by_id()
+    
+    results = []
+    for level_id, score in search_index.search(query, limit):
+        level = main_levels.get(level_id) or legacy_levels.get(level_id)
+        if level:
+            results.append(level)
+    return results
+
+def stream_page(template_name, **context):
+    """Stream a template so the page header is flushed before the list is read"""
+    # The session is saved before a streamed body renders: pop the flashed
+    # messages now (they stay cached on the request for layout.html)
+    get_flashed_messages(with_categories=True)
+    response = app.response_class(stream_template(template_name, **context))
+    # Stop reverse proxies (nginx) from buffering the whole streamed body
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 def send_discord_notification_direct(username, level_name, progress, video_url):
     """Direct Discord notification without external file"""
-    import requests
     import os
     
     webhook_url = os.environ.get('DISCORD_WEBHOOK_URL')
     website_url = os.environ.get('WEBSITE_URL', 'http://localhost:10000')
     
     if not webhook_url:
-        print("❌ No Discord webhook URL configured")
+        log.warning("No Discord webhook URL configured")
         return
     
-    print(f"🔔 Sending direct Discord notification for {username}")
+    log.info("Sending direct Discord notification for %s", username)
     
     embed = {
         "title": "📝 New Record Submission",
@@ -249,26 +349,74 @@ def send_discord_notification_direct(username, level_name, progress, video_url):
     })
     
     try:
-        response = requests.post(
+        response = http_client.post(
             webhook_url,
             json={"embeds": [embed]},
-            headers={"Content-Type": "application/json"},
-            timeout=10
+            headers={"Content-Type": "application/json"}
         )
         
-        print(f"📡 Discord API response: {response.status_code}")
-        
         if response.status_code == 204:
-            print("✅ Direct Discord notification sent successfully")
-        else:
-            print(f"❌ Discord webhook failed: {response.status_code} - {response.text}")
+            log.info("Direct Discord notification sent")
+            return True
+        log.warning("Discord webhook failed: %s - %s", response.status_code, response.text[:500])
+        return False
             
-    except Exception as e:
-        print(f"❌ Direct Discord notification error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Direct Discord notification error")
+        return False
+
+def deliver_record_submitted(payload):
+    discord = load_discord()
+    if discord:
+        return discord.notify_record_submitted(payload['username'], payload['level_name'], payload['progress'], payload['video_url'])
+    # Fallback: send Discord notification directly
+    return send_discord_notification_direct(payload['username'], payload['level_name'], payload['progress'], payload['video_url'])
+
+def deliver_record_approved(payload):
+    discord = load_discord()
+    if not discord:
+        log.warning("Discord integration not available - notify_record_approved")
+        return False
+    return discord.notify_record_approved(payload['username'], payload['level_name'], payload['progress'], payload['points_earned'])
+
+def deliver_record_rejected(payload):
+    discord = load_discord()
+    if not discord:
+        log.warning("Discord integration not available - notify_record_rejected")
+        return False
+    return discord.notify_record_rejected(payload['username'], payload['level_name'], payload['progress'], payload.get('reason'))
+
+# Outbox message kind -> delivery function (returns True once delivered)
+NOTIFICATION_HANDLERS = {
+    'record_submitted': deliver_record_submitted,
+    'record_approved': deliver_record_approved,
+    'record_rejected': deliver_record_rejected,
+}
+
+def deliver_notifications(notifications):
+    """Outbox batch handler: batched and coalesced by the Discord integration, else one at a time"""
+    discord = load_discord()
+    if discord:
+        return discord.send_notifications(notifications)
+    results = []
+    for kind, payload in notifications:
+        try:
+            results.append(bool(NOTIFICATION_HANDLERS[kind](payload)))
+        except Exception:
+            log.exception("Could not deliver %s notification", kind)
+            results.append(False)
+    return results
+
+outbox_worker = OutboxWorker(mongo_db, NOTIFICATION_HANDLERS, batch_handler=deliver_notifications)
+
+# Background database ping; routes and /readyz read its cached result
+health = HealthMonitor(get_client)
+
 
-print("Setting up routes...")
+from api_v1 import api_v1, json_response
+app.extensions['mongo_db'] = mongo_db
+app.extensions['get_cached_list'] = get_cached_list
+app.register_blueprint(api_v1)
 
 @app.route('/test')
 def test():
@@ -285,7 +433,7 @@ def test_discord():
     
     result = f"""
     <h1>Discord Integration Test</h1>
-    <p><strong>Discord Available:</strong> {DISCORD_AVAILABLE}</p>
+    <p><strong>Discord Available:</strong> {load_discord() is not None}</p>
     <p><strong>Webhook URL:</strong> {'✅ Set' if webhook_url else '❌ Missing'}</p>
     <p><strong>Website URL:</strong> {website_url or '❌ Missing'}</p>
     """
@@ -294,8 +442,8 @@ def test_discord():
         result += f"<p><strong>Webhook (first 50 chars):</strong> {webhook_url[:50]}...</p>"
     
     try:
-        if DISCORD_AVAILABLE:
-            notify_record_submitted('TestUser', 'Test Level', 99, 'https://youtube.com/test')
+        if load_discord():
+            load_discord().notify_record_submitted('TestUser', 'Test Level', 99, 'https://youtube.com/test')
             result += "<p>✅ Discord test notification sent!</p>"
         else:
             result += "<p>❌ Discord integration not available</p>"
@@ -308,27 +456,39 @@ def test_discord():
 
 @app.route('/')
 def index():
-    print("Index route accessed")
+    # A cold cache with the database known to be down would fail halfway through the stream
+    if list_cache.fresh('main') is None and not health.database_ok():
+        return render_template('index.html', levels=[])
     try:
-        print("Querying database...")
-        # Quick test query first
-        mongo_db.levels.find_one()
-        print("Database responsive")
-        main_list = list(mongo_db.levels.find({"is_legacy": False}).sort("position", 1))
-        print(f"Found {len(main_list)} levels")
-        print("Rendering template...")
-        result = render_template('index.html', levels=main_list)
-        print("Template rendered successfully")
-        return result
-    except Exception as e:
-        print(f"Error in index: {e}")
+        # Levels are pulled from the cache or the cursor as the template renders
+        main_list = list_cache.stream('main', lambda: level_list_cursor(False))
+        return stream_page('index.html', levels=main_list)
+    except Exception:
+        log.exception("Error in index")
         return render_template('index.html', levels=[])
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests; never touches the database"""
+    return json_response({"status": "ok", "pid": os.getpid()})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness from the cached background check: 503 while the database is unreachable"""
+    if health.last is None:
+        # Checker not started (TESTING) or not finished its first ping yet
+        health.check()
+    ready = health.ready()
+    status = health.status()
+    status["status"] = "ready" if ready else "unavailable"
+    status["notification_worker"] = outbox_worker.is_running()
+    return json_response(status, status=200 if ready else 503)
+
 # Routes
 
 @app.route('/legacy')
 def legacy():
-    legacy_list = list(mongo_db.levels.find({"is_legacy": True}).sort("position", 1))
+    legacy_list = get_cached_list('legacy').items
     return render_template('legacy.html', levels=legacy_list)
 
 @app.route('/timemachine')
@@ -349,6 +509,95 @@ def timemachine():
     
     return render_template('timemachine.html', levels=levels, selected_date=selected_date)
 
+@app.errorhandler(413)
+def request_too_large(error):
+    flash(f'Upload is too large (the limit is {MAX_THUMBNAIL_BYTES // (1024 * 1024)} MB)', 'danger')
+    return redirect(url_for('admin_levels') if request.path.startswith('/admin') else url_for('index'))
+
+@app.route('/thumbnails/<digest>')
+def thumbnail(digest):
+    """Serve a stored thumbnail; the URL is its content hash, so it never changes"""
+    if not is_thumbnail_hash(digest) or not os.path.exists(thumbnail_path(digest)):
+        abort(404)
+    response = send_file(
+        thumbnail_path(digest),
+        mimetype=read_thumbnail_type(digest),
+        etag=digest,
+        conditional=True,
+        max_age=31536000
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/thumbnails/<digest>/<variant>.<fmt>')
+def thumbnail_variant(digest, variant, fmt):
+    """Serve a resized thumbnail variant (see thumbnail_variants.py)"""
+    try:
+        path = variant_path(digest, variant, fmt)
+    except ValueError:
+        abort(404)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(
+        path,
+        mimetype=FORMATS[fmt][1],
+        etag=f"{digest}_{variant}.{fmt}",
+        conditional=True,
+        max_age=31536000
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/yt/<video_id>/<variant>.<fmt>')
+def youtube_thumbnail(video_id, variant, fmt):
+    """Serve a YouTube thumbnail from the local cache, fetching it in the background if needed"""
+    if not is_video_id(video_id) or variant not in YOUTUBE_VARIANTS or fmt not in FORMATS:
+        abort(404)
+    path = cached_youtube_thumbnail(video_id, variant, fmt)
+    if not path:
+        # Not cached yet (or YouTube failed): send the browser to YouTube's own image meanwhile
+        return redirect(f'https://img.youtube.com/vi/{video_id}/mqdefault.jpg')
+    response = send_file(path, mimetype=FORMATS[fmt][1], conditional=True, max_age=2592000)
+    response.headers['Cache-Control'] = 'public, max-age=2592000'
+    return response
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    results = search_levels(query, limit=50) if query else []
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/admin/http_metrics')
+def admin_http_metrics():
+    """Outbound connection pool reuse for this worker process"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        abort(403)
+    return json_response({"pid": os.getpid(), "hosts": http_client.http_metrics()})
+
+@app.route('/admin/db_metrics')
+def admin_db_metrics():
+    """MongoDB pool usage and connection wait times for this worker process"""
+    if 'user_id' not in session or not session.get('is_admin'):
+        abort(403)
+    return json_response({"pid": os.getpid(), "timeouts": OPERATION_TIMEOUTS, "pool": pool_metrics()})
+
+@app.route('/search/autocomplete')
+def search_autocomplete():
+    query = request.args.get('q', '').strip()
+    suggestions = [
+        {
+            "id": level['_id'],
+            "name": level.get('name'),
+            "creator": level.get('creator'),
+            "verifier": level.get('verifier'),
+            "position": level.get('position'),
+            "is_legacy": level.get('is_legacy', False),
+            "url": url_for('level_detail', level_id=level['_id'])
+        }
+        for level in search_levels(query, limit=8)
+    ] if query else []
+    return json_response({"query": query, "results": suggestions})
+
 @app.route('/level/<level_id>')
 def level_detail(level_id):
     try:
@@ -424,6 +673,7 @@ def register():
         }
         
         mongo_db.users.insert_one(new_user)
+        list_cache.invalidate('players')
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('login'))
     
@@ -450,6 +700,7 @@ def toggle_theme():
 
 @app.route('/auth/google')
 def google_login():
+    google = get_google()
     if not google:
         flash('Google Sign-In is not configured', 'danger')
         return redirect(url_for('login'))
@@ -458,6 +709,7 @@ def google_login():
 
 @app.route('/auth/google/callback')
 def google_callback():
+    google = get_google()
     if not google:
         flash('Google Sign-In is not configured', 'danger')
         return redirect(url_for('login'))
@@ -506,6 +758,7 @@ def google_callback():
                     "date_joined": datetime.now(timezone.utc)
                 }
                 mongo_db.users.insert_one(user)
+                list_cache.invalidate('players')
         
         # Log in the user
         session['user_id'] = user['_id']
@@ -604,30 +857,28 @@ def submit_record():
             "level_id": level_id,
             "progress": progress,
             "video_url": video_url,
+            "video_embed": normalize_video(video_url),
             "status": "pending",
             "date_submitted": datetime.now(timezone.utc)
         }
         
         mongo_db.records.insert_one(new_record)
         
-        # Send Discord notification
+        # Queue the Discord notification; the outbox worker delivers it
         try:
             user = mongo_db.users.find_one({"_id": session['user_id']})
             username = user['username'] if user else 'Unknown'
-            print(f"🔔 Sending Discord notification for {username} - {level['name']} - {progress}%")
-            
-            # Try the imported function first
-            if DISCORD_AVAILABLE:
-                notify_record_submitted(username, level['name'], progress, video_url)
-            else:
-                # Fallback: send Discord notification directly
-                send_discord_notification_direct(username, level['name'], progress, video_url)
-            
-            print(f"✅ Discord notification sent successfully")
-        except Exception as e:
-            print(f"❌ Discord notification error: {e}")
-            import traceback
-            traceback.print_exc()
+            enqueue_notification(mongo_db, 'record_submitted', {
+                'record_id': next_id,
+                'username': username,
+                'level_id': level_id,
+                'level_name': level['name'],
+                'progress': progress,
+                'video_url': video_url
+            })
+            log.info("Queued record_submitted notification", extra={"record_id": next_id, "level_id": level_id})
+        except Exception:
+            log.exception("Could not queue the Discord notification")
         
         flash('Record submitted successfully! It will be reviewed by moderators.', 'success')
         return redirect(url_for('profile'))
@@ -684,39 +935,18 @@ def admin_levels():
         video_url = request.form.get('video_url')
         thumbnail_url = request.form.get('thumbnail_url')
         
-        # Handle file upload - save to JSON and convert to base64
+        thumbnail_url, thumbnail_hash = parse_thumbnail_field(thumbnail_url)
+        
+        # Handle file upload - store in the content-addressed thumbnail store
         if 'thumbnail_file' in request.files:
             file = request.files['thumbnail_file']
             if file and file.filename:
-                import base64
-                import json
-                import time
-                file_data = file.read()
-                file_ext = file.filename.split('.')[-1].lower()
-                mime_type = f'image/{file_ext}' if file_ext in ['png', 'jpg', 'jpeg', 'gif', 'webp'] else 'image/png'
-                base64_data = base64.b64encode(file_data).decode('utf-8')
-                thumbnail_url = f'data:{mime_type};base64,{base64_data}'
-                
-                # Save to JSON file
-                json_file = 'thumbnails.json'
                 try:
-                    with open(json_file, 'r') as f:
-                        thumbnails = json.load(f)
-                except:
-                    thumbnails = {}
-                
-                thumbnails[name] = {
-                    'base64': base64_data,
-                    'mime_type': mime_type,
-                    'filename': file.filename,
-                    'timestamp': int(time.time())
-                }
-                
-                with open(json_file, 'w') as f:
-                    json.dump(thumbnails, f, indent=2)
-                    
-                print(f"Thumbnail uploaded: {mime_type}, size: {len(base64_data)} chars")
-                print(f"Thumbnail URL: {thumbnail_url[:100]}...")
+                    thumbnail_hash = save_uploaded_thumbnail(file, name)
+                except ThumbnailRejected as e:
+                    flash(str(e), 'danger')
+                    return redirect(url_for('admin_levels'))
+                thumbnail_url = None
         
         description = request.form.get('description')
         difficulty = float(request.form.get('difficulty'))
@@ -734,7 +964,7 @@ def admin_levels():
             points = calculate_level_points(position, is_legacy, level_type)
         
         # Shift existing levels at this position and below
-        shift_level_positions(position, is_legacy, 1)
+        shift_level_positions(position, is_legacy, 1, caused_by=next_id)
         
         new_level = {
             "_id": next_id,
@@ -743,7 +973,11 @@ def admin_levels():
             "verifier": verifier,
             "level_id": level_id or None,
             "video_url": video_url,
+            "video_embed": normalize_video(video_url),
             "thumbnail_url": thumbnail_url,
+            "thumbnail_hash": thumbnail_hash,
+            "thumbnail_variants": [],
+            "thumbnail_placeholder": None,
             "description": description,
             "difficulty": difficulty,
             "position": position,
@@ -755,37 +989,48 @@ def admin_levels():
         }
         
         mongo_db.levels.insert_one(new_level)
+        search_index.upsert(new_level)
+        add_reference(thumbnail_hash)
+        
+        # Resize in the background; templates use the original until variants exist
+        if thumbnail_hash:
+            schedule_variants(thumbnail_hash, on_done=mark_thumbnail_variants)
         
         # Recalculate points for all levels after position changes
         recalculate_all_points()
         
         # Save history
-        history_entry = {
-            "level_id": next_id,
-            "action": "added",
-            "new_data": new_level,
-            "timestamp": datetime.now(timezone.utc)
-        }
-        mongo_db.level_history.insert_one(history_entry)
+        record_level_added(mongo_db, new_level)
         
         flash('Level added successfully!', 'success')
         return redirect(url_for('admin_levels'))
     
-    levels = list(mongo_db.levels.find().sort([("is_legacy", 1), ("position", 1)]))
-    
-    # Debug: Check thumbnail URLs and file existence
-    import os
-    for level in levels:
-        thumb = level.get('thumbnail_url', '')
-        if thumb:
-            if thumb.startswith('/static/uploads/'):
-                file_path = thumb[1:]  # Remove leading slash
-                exists = os.path.exists(file_path)
-                print(f"Level {level['name']}: FILE {file_path} - {'EXISTS' if exists else 'MISSING'}")
-            else:
-                print(f"Level {level['name']}: URL {thumb}")
-    
-    return render_template('admin/levels.html', levels=levels)
+    # Debug logging: check thumbnail URLs and file existence as each level is streamed
+    def check_thumbnails(levels):
+        for level in levels:
+            thumb = level.get('thumbnail_url', '')
+            if level.get('thumbnail_hash'):
+                exists = os.path.exists(thumbnail_path(level['thumbnail_hash']))
+                log.debug("Level %s: BLOB %s - %s", level['name'], level['thumbnail_hash'], 'EXISTS' if exists else 'MISSING')
+            elif thumb:
+                if thumb.startswith('/static/uploads/'):
+                    file_path = thumb[1:]  # Remove leading slash
+                    exists = os.path.exists(file_path)
+                    log.debug("Level %s: FILE %s - %s", level['name'], file_path, 'EXISTS' if exists else 'MISSING')
+                else:
+                    log.debug("Level %s: URL %s", level['name'], thumb[:100])
+            yield level
+    
+    # Without debug logging the cursors go straight to the template
+    debug = log.isEnabledFor(logging.DEBUG)
+    
+    # Both cursors are lazy; each is only read when the template reaches its table
+    return stream_page(
+        'admin/levels.html',
+        main_levels=check_thumbnails(level_list_cursor(False)) if debug else level_list_cursor(False),
+        legacy_levels=check_thumbnails(level_list_cursor(True)) if debug else level_list_cursor(True),
+        max_thumbnail_mb=MAX_THUMBNAIL_BYTES // (1024 * 1024)
+    )
 
 @app.route('/admin/edit_level', methods=['POST'])
 def admin_edit_level():
@@ -798,7 +1043,10 @@ def admin_edit_level():
 
     
     level = mongo_db.levels.find_one({"_id": db_level_id})
-    thumbnail_url = request.form.get('thumbnail_url') or level.get('thumbnail_url', '')
+    if request.form.get('thumbnail_url'):
+        thumbnail_url, thumbnail_hash = parse_thumbnail_field(request.form.get('thumbnail_url'))
+    else:
+        thumbnail_url, thumbnail_hash = level.get('thumbnail_url', ''), level.get('thumbnail_hash')
     
     # Handle position changes
     old_position = level['position']
@@ -806,37 +1054,16 @@ def admin_edit_level():
     
 
     
-    # Handle file upload - save to JSON and convert to base64
+    # Handle file upload - store in the content-addressed thumbnail store
     if 'thumbnail_file' in request.files:
         file = request.files['thumbnail_file']
         if file and file.filename:
-            import base64
-            import json
-            import time
-            file_data = file.read()
-            file_ext = file.filename.split('.')[-1].lower()
-            mime_type = f'image/{file_ext}' if file_ext in ['png', 'jpg', 'jpeg', 'gif', 'webp'] else 'image/png'
-            base64_data = base64.b64encode(file_data).decode('utf-8')
-            thumbnail_url = f'data:{mime_type};base64,{base64_data}'
-            
-            # Save to JSON file
-            json_file = 'thumbnails.json'
-            level_name = request.form.get('name', 'unknown')
             try:
-                with open(json_file, 'r') as f:
-                    thumbnails = json.load(f)
-            except:
-                thumbnails = {}
-            
-            thumbnails[level_name] = {
-                'base64': base64_data,
-                'mime_type': mime_type,
-                'filename': file.filename,
-                'timestamp': int(time.time())
-            }
-            
-            with open(json_file, 'w') as f:
-                json.dump(thumbnails, f, indent=2)
+                thumbnail_hash = save_uploaded_thumbnail(file, request.form.get('name', 'unknown'))
+            except ThumbnailRejected as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('admin_levels'))
+            thumbnail_url = None
     
     points_str = request.form.get('points')
     min_percentage = int(request.form.get('min_percentage', '100'))
@@ -849,28 +1076,16 @@ def admin_edit_level():
             # Same list, just moving position
             if old_position < position:
                 # Moving down: shift levels between old and new position up
-                mongo_db.levels.update_many(
-                    {"position": {"$gt": old_position, "$lte": position}, "is_legacy": is_legacy},
-                    {"$inc": {"position": -1}}
-                )
+                shift_level_positions(old_position + 1, is_legacy, -1, end=position, caused_by=db_level_id)
             elif old_position > position:
                 # Moving up: shift levels between new and old position down
-                mongo_db.levels.update_many(
-                    {"position": {"$gte": position, "$lt": old_position}, "is_legacy": is_legacy},
-                    {"$inc": {"position": 1}}
-                )
+                shift_level_positions(position, is_legacy, 1, end=old_position - 1, caused_by=db_level_id)
         else:
             # Moving between lists
             # Remove from old list (shift positions down)
-            mongo_db.levels.update_many(
-                {"position": {"$gt": old_position}, "is_legacy": old_is_legacy},
-                {"$inc": {"position": -1}}
-            )
+            shift_level_positions(old_position + 1, old_is_legacy, -1, caused_by=db_level_id)
             # Add to new list (shift positions up)
-            mongo_db.levels.update_many(
-                {"position": {"$gte": position}, "is_legacy": is_legacy},
-                {"$inc": {"position": 1}}
-            )
+            shift_level_positions(position, is_legacy, 1, caused_by=db_level_id)
     
     # Calculate points
     if points_str and points_str.strip():
@@ -885,7 +1100,11 @@ def admin_edit_level():
         "verifier": request.form.get('verifier'),
         "level_id": game_level_id if game_level_id and game_level_id.strip() else None,
         "video_url": request.form.get('video_url'),
+        "video_embed": normalize_video(request.form.get('video_url')),
         "thumbnail_url": thumbnail_url,
+        "thumbnail_hash": thumbnail_hash,
+        "thumbnail_variants": level.get('thumbnail_variants', []) if thumbnail_hash == level.get('thumbnail_hash') else [],
+        "thumbnail_placeholder": level.get('thumbnail_placeholder') if thumbnail_hash == level.get('thumbnail_hash') else None,
         "description": request.form.get('description'),
         "difficulty": float(request.form.get('difficulty')),
         "position": position,
@@ -895,17 +1114,18 @@ def admin_edit_level():
         "min_percentage": min_percentage
     }
     
-    # Save history before updating
-    history_entry = {
-        "level_id": db_level_id,
-        "action": "updated",
-        "old_data": level,
-        "new_data": update_data,
-        "timestamp": datetime.now(timezone.utc)
-    }
-    mongo_db.level_history.insert_one(history_entry)
+    # Save history before updating (only the fields that changed)
+    record_level_updated(mongo_db, level, update_data)
     
     mongo_db.levels.update_one({"_id": db_level_id}, {"$set": update_data})
+    search_index.upsert(dict(level, **update_data))
+    if thumbnail_hash != level.get('thumbnail_hash'):
+        add_reference(thumbnail_hash)
+        release_reference(level.get('thumbnail_hash'))
+    
+    # Resize in the background; templates use the original until variants exist
+    if thumbnail_hash and not update_data['thumbnail_variants']:
+        schedule_variants(thumbnail_hash, on_done=mark_thumbnail_variants)
     
     # Recalculate points for all levels after position changes
     recalculate_all_points()
@@ -934,22 +1154,15 @@ def admin_delete_level():
     mongo_db.records.delete_many({"level_id": level_id})
     
     # Save history before deleting
-    history_entry = {
-        "level_id": level_id,
-        "action": "deleted",
-        "old_data": level,
-        "timestamp": datetime.now(timezone.utc)
-    }
-    mongo_db.level_history.insert_one(history_entry)
+    record_level_deleted(mongo_db, level)
     
     # Delete the level
     mongo_db.levels.delete_one({"_id": level_id})
+    search_index.remove(level_id)
+    release_reference(level.get('thumbnail_hash'))
     
     # Shift positions of levels that were below the deleted level
-    mongo_db.levels.update_many(
-        {"position": {"$gt": level_position}, "is_legacy": is_legacy},
-        {"$inc": {"position": -1}}
-    )
+    shift_level_positions(level_position + 1, is_legacy, -1, caused_by=level_id)
     
     # Recalculate points for all levels after position changes
     recalculate_all_points()
@@ -981,16 +1194,15 @@ def admin_move_to_legacy():
     new_position = 1 if not highest_legacy else highest_legacy['position'] + 1
     
     # Move level to legacy
+    move_data = {"is_legacy": True, "position": new_position}
+    record_level_updated(mongo_db, level, move_data)
     mongo_db.levels.update_one(
         {"_id": level_id},
-        {"$set": {"is_legacy": True, "position": new_position}}
+        {"$set": move_data}
     )
     
     # Shift positions in the main list
-    mongo_db.levels.update_many(
-        {"position": {"$gt": old_position}, "is_legacy": False},
-        {"$inc": {"position": -1}}
-    )
+    shift_level_positions(old_position + 1, False, -1, caused_by=level_id)
     
     # Recalculate points for all levels after position changes
     recalculate_all_points()
@@ -1016,21 +1228,17 @@ def admin_move_to_main():
     old_position = level['position']
     
     # Shift positions in the legacy list
-    mongo_db.levels.update_many(
-        {"position": {"$gt": old_position}, "is_legacy": True},
-        {"$inc": {"position": -1}}
-    )
+    shift_level_positions(old_position + 1, True, -1, caused_by=level_id)
     
     # Shift positions in the main list
-    mongo_db.levels.update_many(
-        {"position": {"$gte": position}, "is_legacy": False},
-        {"$inc": {"position": 1}}
-    )
+    shift_level_positions(position, False, 1, caused_by=level_id)
     
     # Move level to main list
+    move_data = {"is_legacy": False, "position": position}
+    record_level_updated(mongo_db, level, move_data)
     mongo_db.levels.update_one(
         {"_id": level_id},
-        {"$set": {"is_legacy": False, "position": position}}
+        {"$set": move_data}
     )
     
     # Recalculate points for all levels after position changes
@@ -1055,20 +1263,20 @@ def admin_approve_record(record_id):
         # Update user points
         update_user_points(record['user_id'])
         
-        # Send Discord notification
+        # Queue the Discord notification
         try:
             user = mongo_db.users.find_one({"_id": record['user_id']})
             level = mongo_db.levels.find_one({"_id": record['level_id']})
             if user and level:
-                points_earned = calculate_record_points(record, level)
-                notify_record_approved(
-                    user['username'], 
-                    level['name'], 
-                    record['progress'], 
-                    points_earned
-                )
-        except Exception as e:
-            print(f"Discord notification error: {e}")
+                enqueue_notification(mongo_db, 'record_approved', {
+                    'record_id': record_id,
+                    'username': user['username'],
+                    'level_name': level['name'],
+                    'progress': record['progress'],
+                    'points_earned': calculate_record_points(record, level)
+                })
+        except Exception:
+            log.exception("Could not queue the Discord notification")
         
         flash('Record approved successfully!', 'success')
     
@@ -1088,19 +1296,20 @@ def admin_reject_record(record_id):
         {"$set": {"status": "rejected"}}
     )
     
-    # Send Discord notification
+    # Queue the Discord notification
     if record:
         try:
             user = mongo_db.users.find_one({"_id": record['user_id']})
             level = mongo_db.levels.find_one({"_id": record['level_id']})
             if user and level:
-                notify_record_rejected(
-                    user['username'], 
-                    level['name'], 
-                    record['progress']
-                )
-        except Exception as e:
-            print(f"Discord notification error: {e}")
+                enqueue_notification(mongo_db, 'record_rejected', {
+                    'record_id': record_id,
+                    'username': user['username'],
+                    'level_name': level['name'],
+                    'progress': record['progress']
+                })
+        except Exception:
+            log.exception("Could not queue the Discord notification")
     
     flash('Record rejected!', 'warning')
     return redirect(url_for('admin'))
@@ -1137,6 +1346,7 @@ def admin_users():
             }
             
             mongo_db.users.insert_one(new_user)
+            list_cache.invalidate('players')
             flash('User created successfully!', 'success')
     
     users = list(mongo_db.users.find().sort("date_joined", -1))
@@ -1183,6 +1393,7 @@ def admin_ban_user(user_id):
         
         # Delete the user
         mongo_db.users.delete_one({"_id": user_id})
+        list_cache.invalidate('players')
         
         flash(f'User {user["username"]} has been banned and deleted', 'success')
     
@@ -1206,6 +1417,7 @@ def admin_update_points():
                 {"$set": {"points": new_points}}
             )
             updated_count += 1
+    list_cache.invalidate('main', 'legacy')
     
     # Recalculate all user points
     users = list(mongo_db.users.find())
@@ -1215,5 +1427,69 @@ def admin_update_points():
     flash(f'Updated {updated_count} levels and recalculated all user points!', 'success')
     return redirect(url_for('admin_levels'))
 
+def reconcile_indexes():
+    """Bring the database's indexes in line with db_indexes.py"""
+    try:
+        with operation_timeout('batch'):
+            changes = ensure_indexes(mongo_db)
+        for collection_name, index_name, action in changes:
+            log.info("Index %s.%s: %s", collection_name, index_name, action)
+        log.info("Database indexes reconciled")
+    except Exception as e:
+        log.warning("Index creation warning: %s", e)
+
+def start_background_tasks():
+    """Index reconciliation, the health check and the notification worker, on threads of this process"""
+    health.start()
+    if app.config['DB_INDEXES_ON_STARTUP']:
+        threading.Thread(target=reconcile_indexes, name='ensure-indexes', daemon=True).start()
+    # NOTIFICATION_TRANSPORT=bot leaves delivery to discord_bot.py, which reads the same outbox
+    if os.environ.get('NOTIFICATION_WORKER', 'true').lower() != 'false' \
+            and os.environ.get('NOTIFICATION_TRANSPORT', 'webhook').lower() != 'bot':
+        outbox_worker.start()
+
+def background_tasks_enabled():
+    return not app.testing and app.config['BACKGROUND_TASKS']
+
+_import_ms = (time.perf_counter() - _import_started) * 1000
+
+def create_app(config=None):
+    """Configure the app and start its background work once per process
+
+    This is not a full factory: routes are registered on the module-level
+    app when main is imported, which does no database or network I/O
+    (MongoDB connects on the first query, Google OAuth and the Discord
+    integration are imported when first used). With TESTING set, or
+    BACKGROUND_TASKS false, nothing is started, so test clients and scripts
+    can use the app without threads touching the database.
+    """
+    if config:
+        app.config.update(config)
+    # Keyed by pid: threads do not survive fork, so each worker process starts its own
+    if app.extensions.get('rtl_started') == os.getpid():
+        return app
+    app.extensions['rtl_started'] = os.getpid()
+
+    started = time.perf_counter()
+    if background_tasks_enabled():
+        start_background_tasks()
+    total_ms = _import_ms + (time.perf_counter() - started) * 1000
+    app.config['STARTUP_MS'] = round(total_ms, 1)
+    if total_ms > STARTUP_BUDGET_MS:
+        log.warning("Startup took %.0f ms (import %.0f ms), over the %.0f ms budget",
+                    total_ms, _import_ms, STARTUP_BUDGET_MS)
+    else:
+        log.info("App ready in %.0f ms", total_ms)
+    return app
+
+@app.before_request
+def ensure_started():
+    # Servers that load main:app directly never call create_app();
+    # test clients (TESTING) and BACKGROUND_TASKS=false start nothing here
+    if app.extensions.get('rtl_started') != os.getpid() and background_tasks_enabled():
+        create_app()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=10000, debug=True)
\ No newline at end of file
+    # Development server; production runs gunicorn -c gunicorn.conf.py wsgi:app (see DEPLOYMENT.md)
+    debug = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true')
+    create_app().run(host="0.0.0.0", port=int(os.environ.get('PORT', '10000')), debug=debug)
\ No newline at end of file
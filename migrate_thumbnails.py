@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Move inline base64 thumbnails out of MongoDB documents into the thumbnail store
+
+Covers levels.thumbnail_url, the old_data/new_data snapshots of old
+level_history entries and the level_history_blobs collection. Documents
+are streamed in _id order and rewritten with bulk writes; progress is
+checkpointed in the migrations collection so an interrupted run resumes
+where it stopped. Every update is conditional on the document still
+holding the data URI that was read, so it is safe to run on a live site.
+Extracted blobs are indexed in thumbnails.db and every rewritten level
+counts as a reference, as uploads do.
+
+    python migrate_thumbnails.py [--batch-size 100] [--throttle 0.1] [--variants] [--restart]
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import os
+import re
+import time
+import zlib
+
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+from thumbnail_dedup import add_reference, register_blob
+from thumbnail_store import store_thumbnail, thumbnail_path
+
+DATA_URI = re.compile(r'^data:image/[a-z0-9.+-]+;base64,', re.IGNORECASE)
+DATA_URI_QUERY = {"$regex": "^data:image/"}
+
+
+class MigrationStats:
+    def __init__(self):
+        self.documents = 0
+        self.images = 0
+        self.new_blobs = 0
+        self.bytes_removed = 0
+        self.bytes_added = 0
+        self.failed = 0
+
+    def report(self):
+        reclaimed = self.bytes_removed - self.bytes_added
+        print(f"  Documents rewritten: {self.documents}")
+        print(f"  Images extracted:    {self.images} ({self.new_blobs} new blobs)")
+        print(f"  Undecodable images:  {self.failed}")
+        print(f"  Removed from MongoDB: {self.bytes_removed / 1024 / 1024:.2f} MB")
+        print(f"  Added to blob store:  {self.bytes_added / 1024 / 1024:.2f} MB")
+        print(f"  Net reclaimed:        {reclaimed / 1024 / 1024:.2f} MB")
+
+
+def extract(data_uri, stats):
+    """Decode a data URI into the blob store and return its hash, or None"""
+    match = DATA_URI.match(data_uri)
+    if not match:
+        return None
+    try:
+        data = base64.b64decode(data_uri[match.end():])
+    except (binascii.Error, ValueError):
+        stats.failed += 1
+        return None
+
+    existed = os.path.exists(thumbnail_path(hashlib.sha256(data).hexdigest()))
+    digest = store_thumbnail(data)
+    # Index the blob right away so thumbnail_dedup.py report/prune see it
+    register_blob(digest, data)
+    stats.images += 1
+    stats.bytes_removed += len(data_uri)
+    if not existed:
+        stats.new_blobs += 1
+        stats.bytes_added += len(data)
+    return digest
+
+
+def get_checkpoint(db, name):
+    state = db.migrations.find_one({"_id": name})
+    return state.get("last_id") if state else None
+
+
+def set_checkpoint(db, name, last_id):
+    db.migrations.update_one({"_id": name}, {"$set": {"last_id": last_id}}, upsert=True)
+
+
+def iterate_batches(collection, query, projection, checkpoint, batch_size):
+    """Stream matching documents in _id order, batch_size at a time"""
+    if checkpoint is not None:
+        query = {"$and": [query, {"_id": {"$gt": checkpoint}}]}
+    batch = []
+    for doc in collection.find(query, projection).sort("_id", 1).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_levels(db, args, stats, new_hashes):
+    name = "thumbnails_levels"
+    checkpoint = None if args.restart else get_checkpoint(db, name)
+    query = {"thumbnail_url": DATA_URI_QUERY}
+
+    for batch in iterate_batches(db.levels, query, {"thumbnail_url": 1}, checkpoint, args.batch_size):
+        operations = []
+        rewritten = {}
+        for level in batch:
+            digest = extract(level['thumbnail_url'], stats)
+            if not digest:
+                continue
+            new_hashes.add(digest)
+            rewritten[level['_id']] = digest
+            operations.append(UpdateOne(
+                {"_id": level['_id'], "thumbnail_url": level['thumbnail_url']},
+                {"$set": {"thumbnail_url": None, "thumbnail_hash": digest, "thumbnail_variants": [], "thumbnail_placeholder": None}}
+            ))
+        if operations:
+            stats.documents += db.levels.bulk_write(operations, ordered=False).modified_count
+            count_level_references(db, rewritten)
+        set_checkpoint(db, name, batch[-1]['_id'])
+        time.sleep(args.throttle)
+
+
+def count_level_references(db, rewritten):
+    """Add a blob reference for every level whose rewrite was applied
+
+    rewritten maps level _id -> extracted hash. The updates are conditional,
+    so a level edited meanwhile is skipped: only levels now pointing at the
+    extracted hash are counted.
+    """
+    for level in db.levels.find({"_id": {"$in": list(rewritten)}}, {"thumbnail_hash": 1}):
+        if level.get('thumbnail_hash') == rewritten[level['_id']]:
+            add_reference(level['thumbnail_hash'])
+
+
+def migrate_history(db, args, stats):
+    """Old-style history entries carried whole level snapshots"""
+    name = "thumbnails_level_history"
+    checkpoint = None if args.restart else get_checkpoint(db, name)
+    fields = ["old_data.thumbnail_url", "new_data.thumbnail_url"]
+    query = {"$or": [{field: DATA_URI_QUERY} for field in fields]}
+    projection = {field: 1 for field in fields}
+
+    for batch in iterate_batches(db.level_history, query, projection, checkpoint, args.batch_size):
+        operations = []
+        for entry in batch:
+            for snapshot in ("old_data", "new_data"):
+                value = (entry.get(snapshot) or {}).get("thumbnail_url")
+                if not isinstance(value, str):
+                    continue
+                digest = extract(value, stats)
+                if not digest:
+                    continue
+                operations.append(UpdateOne(
+                    {"_id": entry['_id'], f"{snapshot}.thumbnail_url": value},
+                    {"$set": {f"{snapshot}.thumbnail_url": None, f"{snapshot}.thumbnail_hash": digest}}
+                ))
+        if operations:
+            stats.documents += db.level_history.bulk_write(operations, ordered=False).modified_count
+        set_checkpoint(db, name, batch[-1]['_id'])
+        time.sleep(args.throttle)
+
+
+def migrate_history_blobs(db, args, stats):
+    """Blobs written by level_history.py for data URIs; keep only the hash"""
+    name = "thumbnails_level_history_blobs"
+    checkpoint = None if args.restart else get_checkpoint(db, name)
+    query = {"data": {"$exists": True}}
+
+    for batch in iterate_batches(db.level_history_blobs, query, {"data": 1}, checkpoint, args.batch_size):
+        operations = []
+        for blob in batch:
+            data_uri = zlib.decompress(blob['data']).decode('utf-8')
+            digest = extract(data_uri, stats)
+            if not digest:
+                continue
+            # The compressed copy is what was actually stored, so count that instead
+            stats.bytes_removed += len(blob['data']) - len(data_uri)
+            operations.append(UpdateOne(
+                {"_id": blob['_id'], "data": {"$exists": True}},
+                {"$set": {"thumbnail_hash": digest}, "$unset": {"data": ""}}
+            ))
+        if operations:
+            stats.documents += db.level_history_blobs.bulk_write(operations, ordered=False).modified_count
+        set_checkpoint(db, name, batch[-1]['_id'])
+        time.sleep(args.throttle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--throttle', type=float, default=0.1, help='seconds to sleep between batches')
+    parser.add_argument('--variants', action='store_true', help='also generate resized variants')
+    parser.add_argument('--restart', action='store_true', help='ignore saved checkpoints')
+    args = parser.parse_args()
+
+    load_dotenv()
+    from database import get_db
+    db = get_db()
+
+    stats = MigrationStats()
+    new_hashes = set()
+
+    print("Migrating levels...")
+    migrate_levels(db, args, stats, new_hashes)
+    print("Migrating level history snapshots...")
+    migrate_history(db, args, stats)
+    print("Migrating level history blobs...")
+    migrate_history_blobs(db, args, stats)
+
+    if args.variants and new_hashes:
+        from thumbnail_variants import generate_variants, variant_fields
+        print(f"Generating variants for {len(new_hashes)} thumbnails...")
+        for digest in new_hashes:
+            variants = generate_variants(digest)
+            db.levels.update_many({"thumbnail_hash": digest}, {"$set": variant_fields(digest, variants)})
+
+    print("✓ Migration complete")
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
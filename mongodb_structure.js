@@ -84,6 +84,8 @@ db.getCollection('records').insertMany([
 ]);
 
 // Create indexes
+// The app reconciles its own indexes at startup from db_indexes.py,
+// which is the source of truth; these are only for a fresh sample database.
 db.users.createIndex({ "username": 1 }, { unique: true });
 db.users.createIndex({ "email": 1 }, { unique: true });
 db.users.createIndex({ "google_id": 1 }, { unique: true, sparse: true });
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Durable notification outbox
+Requests only insert a document into the notification_outbox collection;
+a background worker thread delivers it (Discord webhooks today) and
+retries failures with exponential backoff, so a slow or unavailable
+Discord never holds up a page
+
+With NOTIFICATION_MODE=digest, kinds listed in NOTIFICATION_DIGEST_KINDS
+are held back and released together, either when the first of them has
+waited NOTIFICATION_DIGEST_WINDOW seconds or once NOTIFICATION_DIGEST_MAX
+are waiting, so moderators get one summary instead of a message each
+"""
+
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+
+# Retry after 5s, 10s, 20s ... capped at 15 minutes
+BACKOFF_BASE = 5
+BACKOFF_MAX = 15 * 60
+
+# A message claimed by a worker that died is handed out again after this long;
+# a delivery attempt must finish well inside it (see discord_integration.SEND_BUDGET)
+LEASE_SECONDS = 60
+
+# 'event' sends every notification as soon as possible, 'digest' batches the digest kinds
+NOTIFICATION_MODE = os.environ.get('NOTIFICATION_MODE', 'event').lower()
+DIGEST_WINDOW = float(os.environ.get('NOTIFICATION_DIGEST_WINDOW', '300'))
+DIGEST_MAX = int(os.environ.get('NOTIFICATION_DIGEST_MAX', '20'))
+DIGEST_KINDS = {kind.strip() for kind in os.environ.get('NOTIFICATION_DIGEST_KINDS', 'record_submitted').split(',')
+                if kind.strip()}
+
+_wakeup = threading.Event()
+
+log = logging.getLogger('rtl.outbox')
+
+
+def is_digest_kind(kind):
+    return NOTIFICATION_MODE == 'digest' and kind in DIGEST_KINDS
+
+
+def held_filter(kind, now):
+    """Messages of a kind waiting for their digest window to close"""
+    return {"kind": kind, "status": "pending", "attempts": 0, "next_attempt_at": {"$gt": now}}
+
+
+def enqueue(db, kind, payload):
+    """Queue a notification; returns the outbox document's id"""
+    now = datetime.now(timezone.utc)
+    digest = is_digest_kind(kind)
+    send_at = now
+    if digest:
+        # Join the open window, or open one
+        held = db.notification_outbox.find_one(held_filter(kind, now), sort=[("next_attempt_at", 1)])
+        send_at = held['next_attempt_at'] if held else now + timedelta(seconds=DIGEST_WINDOW)
+
+    result = db.notification_outbox.insert_one({
+        "kind": kind,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": send_at,
+        "last_error": None,
+    })
+
+    if digest and db.notification_outbox.count_documents(held_filter(kind, now)) < DIGEST_MAX:
+        return result.inserted_id
+    if digest:
+        # Enough waiting: close the window early
+        db.notification_outbox.update_many(held_filter(kind, now), {"$set": {"next_attempt_at": now}})
+    # Deliver right away instead of waiting for the next poll
+    _wakeup.set()
+    return result.inserted_id
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Query/update documents shared by OutboxWorker and the Discord bot's async consumer
+
+def due_filter(now):
+    return {"status": "pending", "next_attempt_at": {"$lte": now}}
+
+
+def claim_update(now):
+    return {"$set": {"status": "sending", "locked_until": now + timedelta(seconds=LEASE_SECONDS)}}
+
+
+def expired_lease_filter(now):
+    return {"status": "sending", "locked_until": {"$lt": now}}
+
+
+def finish_filter(message):
+    """Matches a claimed message only while this claim still holds its lease"""
+    return {"_id": message['_id'], "status": "sending", "locked_until": message['locked_until']}
+
+
+def finish_update(message, error, now):
+    """Update marking a claimed message sent (error is None) or scheduling its retry"""
+    if error is None:
+        return {"$set": {"status": "sent", "sent_at": now, "last_error": None},
+                "$inc": {"attempts": 1}, "$unset": {"locked_until": ""}}
+
+    attempts = message['attempts'] + 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        log.error("Giving up on %s notification after %d attempts: %s", message['kind'], attempts, error)
+        update = {"status": "failed", "failed_at": now}
+    else:
+        update = {"status": "pending", "next_attempt_at": now + timedelta(seconds=backoff(attempts))}
+    update.update({"attempts": attempts, "last_error": error})
+    return {"$set": update, "$unset": {"locked_until": ""}}
+
+
+class OutboxWorker:
+    """Drains the outbox on a daemon thread
+
+    handlers maps a notification kind to a function taking the payload and
+    returning True once it has been delivered. False or an exception means
+    "try again later".
+
+    If batch_handler is given it is used instead: it receives every due
+    message at once as a list of (kind, payload) and returns one success
+    flag per message, so a burst can go out as a few combined sends.
+    """
+
+    def __init__(self, db, handlers=None, batch_handler=None, poll_interval=None, batch_size=None):
+        self.db = db
+        self.handlers = handlers or {}
+        self.batch_handler = batch_handler
+        self.poll_interval = poll_interval or OUTBOX_POLL_INTERVAL
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def start(self):
+        # Threads do not survive fork(), so a forked worker process starts its own
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        """True if this process's worker thread is alive (an inherited one from before fork() is not)"""
+        return bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        _wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            _wakeup.clear()
+            try:
+                self.release_expired_leases()
+                process = self.process_batch if self.batch_handler else self.process_one
+                while not self._stop.is_set() and process():
+                    pass
+            except Exception as e:
+                log.error("Notification outbox error: %s", e)
+            _wakeup.wait(self.poll_interval)
+
+    def release_expired_leases(self):
+        self.db.notification_outbox.update_many(
+            expired_lease_filter(datetime.now(timezone.utc)),
+            {"$set": {"status": "pending"}}
+        )
+
+    def claim(self):
+        """Atomically take the next due message, so several workers never send the same one"""
+        now = datetime.now(timezone.utc)
+        return self.db.notification_outbox.find_one_and_update(
+            due_filter(now),
+            claim_update(now),
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def process_one(self):
+        """Deliver one due message; returns False when there was nothing to do"""
+        message = self.claim()
+        if not message:
+            return False
+
+        handler = self.handlers.get(message['kind'])
+        error = None
+        try:
+            if handler is None:
+                error = f"no handler for {message['kind']!r}"
+            elif not handler(message['payload']):
+                error = "handler reported failure"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            log.exception("Notification handler for %s failed", message['kind'])
+        self.finish(message, error)
+        return True
+
+    def process_batch(self):
+        """Deliver every due message (up to batch_size) in one handler call"""
+        messages = []
+        while len(messages) < self.batch_size:
+            message = self.claim()
+            if not message:
+                break
+            messages.append(message)
+        if not messages:
+            return False
+
+        try:
+            results = self.batch_handler([(m['kind'], m['payload']) for m in messages])
+            errors = [None if ok else "handler reported failure" for ok in results]
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {e}"] * len(messages)
+            log.exception("Notification batch handler failed")
+        for message, error in zip(messages, errors):
+            self.finish(message, error)
+        return True
+
+    def finish(self, message, error):
+        """Mark a claimed message sent, or schedule its retry"""
+        result = self.db.notification_outbox.update_one(
+            finish_filter(message),
+            finish_update(message, error, datetime.now(timezone.utc))
+        )
+        if not result.matched_count:
+            log.warning("Lease on %s notification %s expired before it was finished", message['kind'], message['_id'])
+
+
+def outbox_stats(db):
+    """Count of outbox messages per status"""
+    return {row['_id']: row['count'] for row in db.notification_outbox.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ])}
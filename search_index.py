@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+In-memory trigram search index for levels
+Covers level name, creator, verifier and in-game level ID
+"""
+
+import heapq
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Rebuild from the database at least this often, so workers that did not
+# see an admin change themselves still catch up
+SEARCH_INDEX_TTL = float(os.environ.get('SEARCH_INDEX_TTL', '300'))
+
+# Only the best-matching candidates (by shared trigrams) are scored
+MAX_CANDIDATES = 300
+
+# Field weights used when ranking matches
+FIELD_WEIGHTS = {
+    'name': 1.0,
+    'level_id': 0.9,
+    'creator': 0.7,
+    'verifier': 0.6
+}
+
+# Only these fields are needed to build the index
+INDEX_PROJECTION = {field: 1 for field in FIELD_WEIGHTS}
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase and collapse punctuation/whitespace into single spaces"""
+    if text is None:
+        return ''
+    return _NON_ALNUM.sub(' ', str(text).lower()).strip()
+
+
+def trigrams(text, pad_end=True):
+    """Trigrams of every word, padded at the start so they also act as a prefix index"""
+    grams = set()
+    for word in text.split():
+        padded = '  ' + word + (' ' if pad_end else '')
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class LevelSearchIndex:
+    """Trigram postings plus per-field gram sets for fuzzy ranking"""
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._docs = {}                  # level _id -> {field: (text, grams)}
+        self._postings = defaultdict(set)  # trigram -> set of level _id
+        self._changes = None             # upserts/removes made while a rebuild is reading
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > self.ttl
+
+    def ensure_built(self, loader):
+        """Rebuild from loader() if the index is empty or older than the TTL
+
+        Only one caller rebuilds; the others keep searching the old index
+        meanwhile, or wait for the first build if there is none yet.
+        """
+        if not self.is_stale():
+            return
+        if not self._build_lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if self.is_stale():
+                self.rebuild(loader())
+        finally:
+            self._build_lock.release()
+
+    def rebuild(self, levels):
+        """Index levels from scratch; searches keep using the old index until the swap"""
+        with self._lock:
+            self._changes = []
+        try:
+            docs, postings = {}, defaultdict(set)
+            for level in levels:
+                self._add(level, docs, postings)
+            with self._lock:
+                self._docs, self._postings = docs, postings
+                # Admin changes made during the read may be missing from it
+                for level_id, level in self._changes:
+                    self._remove(level_id)
+                    if level is not None:
+                        self._add(level)
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._changes = None
+
+    def upsert(self, level):
+        """Add or replace a single level (called after admin changes)"""
+        with self._lock:
+            self._remove(level['_id'])
+            self._add(level)
+            if self._changes is not None:
+                self._changes.append((level['_id'], level))
+
+    def remove(self, level_id):
+        with self._lock:
+            self._remove(level_id)
+            if self._changes is not None:
+                self._changes.append((level_id, None))
+
+    def _add(self, level, docs=None, postings=None):
+        docs = self._docs if docs is None else docs
+        postings = self._postings if postings is None else postings
+        fields = {}
+        for field in FIELD_WEIGHTS:
+            text = normalize(level.get(field))
+            if not text:
+                continue
+            grams = trigrams(text)
+            fields[field] = (text, grams)
+            for gram in grams:
+                postings[gram].add(level['_id'])
+        docs[level['_id']] = fields
+
+    def _remove(self, level_id):
+        fields = self._docs.pop(level_id, None)
+        if not fields:
+            return
+        for _, grams in fields.values():
+            for gram in grams:
+                ids = self._postings.get(gram)
+                if ids is not None:
+                    ids.discard(level_id)
+                    if not ids:
+                        del self._postings[gram]
+
+    def search(self, query, limit=10):
+        """Return [(level_id, score)] best first
+
+        Exact and prefix matches rank above fuzzy trigram matches, and
+        name matches rank above creator/verifier matches.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        # The last word may still be being typed, so don't pad its end
+        query_grams = trigrams(query, pad_end=False)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            counts = Counter()
+            for gram in query_grams:
+                ids = self._postings.get(gram)
+                if ids:
+                    counts.update(ids)
+
+            # Require a reasonable share of the query's trigrams to match
+            min_hits = max(1, int(len(query_grams) * 0.4))
+            padded_query = ' ' + query
+            results = []
+            for level_id, hits in counts.most_common(MAX_CANDIDATES):
+                if hits < min_hits:
+                    break
+                score = 0.0
+                for field, (text, grams) in self._docs[level_id].items():
+                    if text == query:
+                        base = 1.0
+                    elif text.startswith(query):
+                        base = 0.9
+                    elif padded_query in ' ' + text:
+                        base = 0.8
+                    else:
+                        base = 0.7 * len(query_grams & grams) / len(query_grams | grams)
+                    score = max(score, base * FIELD_WEIGHTS[field])
+                results.append((level_id, score))
+
+        return heapq.nlargest(limit, results, key=lambda item: item[1])
+
+
+# Global index instance
+search_index = LevelSearchIndex()
@@ -93,7 +93,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 const preview = document.createElement('div');
                 preview.classList.add('video-preview');
                 preview.innerHTML = `
-                    <img src="https://img.youtube.com/vi/${videoId}/mqdefault.jpg" alt="Video Preview">
+                    <img src="/yt/${videoId}/preview.jpeg" alt="Video Preview">
                     <div class="play-button"><i class="fas fa-play"></i></div>
                 `;
                 
@@ -135,6 +135,9 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Search autocomplete in the navbar
+    initializeSearchAutocomplete();
+    
     // Theme handling
     initializeTheme();
     
@@ -148,6 +151,65 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+/**
+ * Suggest levels while typing in the navbar search box
+ */
+function initializeSearchAutocomplete() {
+    const input = document.getElementById('navbar-search');
+    const results = document.getElementById('navbar-search-results');
+    if (!input || !results) {
+        return;
+    }
+    
+    let debounceTimer = null;
+    let lastQuery = '';
+    
+    input.addEventListener('input', function() {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(() => {
+            const query = input.value.trim();
+            if (query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            
+            if (!query) {
+                results.classList.remove('show');
+                results.innerHTML = '';
+                return;
+            }
+            
+            fetch(`/search/autocomplete?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    // Ignore responses for queries the user has already typed past
+                    if (data.query !== input.value.trim()) {
+                        return;
+                    }
+                    results.innerHTML = '';
+                    data.results.forEach(level => {
+                        const item = document.createElement('li');
+                        const link = document.createElement('a');
+                        link.className = 'dropdown-item';
+                        link.href = level.url;
+                        link.textContent = `#${level.position} ${level.name} by ${level.creator}`;
+                        item.appendChild(link);
+                        results.appendChild(item);
+                    });
+                    results.classList.toggle('show', data.results.length > 0);
+                })
+                .catch(error => {
+                    console.error('Error fetching search suggestions:', error);
+                });
+        }, 120);
+    });
+    
+    input.addEventListener('blur', function() {
+        // Delay so clicks on a suggestion still register
+        setTimeout(() => results.classList.remove('show'), 200);
+    });
+}
+
 /**
  * Initialize theme on page load
  */
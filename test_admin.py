@@ -9,6 +9,9 @@ sys.path.append('.')
 from main import app, mongo_db
 from flask import session
 
+# Only the routes are under test; keep the outbox worker and index reconciliation out of it
+app.config['BACKGROUND_TASKS'] = False
+
 def test_admin_levels():
     """Test the admin levels route"""
     with app.test_client() as client:
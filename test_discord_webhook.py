@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test script for Discord webhook batching, coalescing and rate limiting
+Runs DiscordNotifier against a local fake webhook server, no Discord needed
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from discord_integration import DiscordNotifier, EMBEDS_PER_MESSAGE, DESCRIPTION_LIMIT, digest_embeds
+
+
+class FakeWebhook(BaseHTTPRequestHandler):
+    """Accepts webhook posts like Discord: 5 per 2 seconds, then 429"""
+    requests = []
+    window_start = time.monotonic()
+    used = 0
+    limit = 5
+    per = 2.0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        cls = FakeWebhook
+        now = time.monotonic()
+        if now - cls.window_start >= cls.per:
+            cls.window_start, cls.used = now, 0
+        reset_after = cls.per - (now - cls.window_start)
+
+        if cls.used >= cls.limit:
+            body = json.dumps({"message": "You are being rate limited.", "retry_after": reset_after}).encode()
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            cls.requests.append(('429', payload))
+            return
+
+        cls.used += 1
+        cls.requests.append(('204', payload))
+        self.send_response(204)
+        self.send_header('X-RateLimit-Limit', str(cls.limit))
+        self.send_header('X-RateLimit-Remaining', str(cls.limit - cls.used))
+        self.send_header('X-RateLimit-Reset-After', f"{reset_after:.3f}")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = HTTPServer(('127.0.0.1', 0), FakeWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    notifier = DiscordNotifier(f"http://127.0.0.1:{server.server_port}/webhook")
+
+    try:
+        # A burst of submissions plus a couple of approvals
+        notifications = [
+            ('record_submitted', {'username': f'player{i}', 'level_name': 'Big New Level', 'progress': 50 + i,
+                                  'video_url': f'https://youtu.be/abcdefghij{i % 10}'})
+            for i in range(40)
+        ]
+        notifications += [
+            ('record_approved', {'username': 'player1', 'level_name': 'Other Level', 'progress': 100, 'points_earned': 150}),
+            ('record_approved', {'username': 'player2', 'level_name': 'Other Level', 'progress': 100, 'points_earned': 150}),
+        ]
+        results = notifier.send_notifications(notifications)
+        sent = [payload for status, payload in FakeWebhook.requests if status == '204']
+        print(f"Burst of {len(notifications)} notifications -> {len(sent)} webhook call(s)")
+        assert all(results), "every notification should be delivered"
+        assert len(sent) == 1 and len(sent[0]['embeds']) == 3, "40 submissions should fold into one digest"
+        print("✓ Burst coalesced into a digest plus individual approvals")
+
+        # Many individual embeds: at most 10 per call, and the rate limit is respected
+        FakeWebhook.requests.clear()
+        embeds = [{"title": f"Embed {i}", "description": "x"} for i in range(70)]
+        start = time.monotonic()
+        results = notifier.send_embeds(embeds)
+        elapsed = time.monotonic() - start
+        statuses = [status for status, _ in FakeWebhook.requests]
+        print(f"70 embeds -> {statuses.count('204')} calls, {statuses.count('429')} rate limited, {elapsed:.2f}s")
+        assert all(results)
+        assert all(len(payload['embeds']) <= EMBEDS_PER_MESSAGE for _, payload in FakeWebhook.requests)
+        assert statuses.count('204') == 7
+        assert statuses.count('429') == 0, "the token bucket should avoid hitting 429"
+        print("✓ Batched 10 embeds per call without tripping the rate limit")
+
+        # A 429 with retry_after is waited out and retried
+        FakeWebhook.requests.clear()
+        FakeWebhook.used = FakeWebhook.limit
+        FakeWebhook.window_start = time.monotonic()
+        notifier.bucket.tokens = notifier.bucket.limit
+        assert notifier.send_webhook({"title": "After 429", "description": "x"})
+        statuses = [status for status, _ in FakeWebhook.requests]
+        print(f"Forced rate limit -> {statuses}")
+        assert statuses == ['429', '204']
+        print("✓ 429 retry_after honoured")
+
+        # Submission digests are grouped by level and split without losing anyone
+        payloads = [{'username': f'player{i}', 'level_id': i % 3, 'level_name': f'Level {i % 3}', 'progress': 60,
+                     'video_url': f'https://www.youtube.com/watch?v=abcdefghij{i % 10}'} for i in range(120)]
+        digests = digest_embeds('record_submitted', payloads)
+        covered = sorted(p for _, positions in digests for p in positions)
+        print(f"120 submissions on 3 levels -> {len(digests)} digest embed(s)")
+        assert covered == list(range(120))
+        assert all(len(embed['description']) <= DESCRIPTION_LIMIT for embed, _ in digests)
+        assert all(embed['description'].startswith('**[Level') for embed, _ in digests)
+        print("✓ Digest grouped by level with links, split within Discord's limits")
+
+        print("\n✅ All Discord webhook tests passed")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script for multi-worker serving
+Checks that a forked process never reuses its parent's MongoClient, then
+serves the app from gunicorn with several preforked workers. No database
+is needed.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+os.environ['MONGODB_URI'] = 'mongodb://127.0.0.1:9/'
+
+WORKERS = 3
+
+
+def check_fork_safety():
+    import database
+
+    parent_client = database.get_client()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        child_client = database.get_client()
+        ok = child_client is not parent_client and database._client_pid == os.getpid()
+        os.write(write_fd, b'1' if ok else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b'1', "the child reused the parent's MongoClient"
+    assert database.get_client() is parent_client, "the parent's client should be untouched"
+    database.close_client()
+    print("✓ A forked child builds its own MongoClient")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def check_gunicorn():
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("- gunicorn is not installed, skipping the server test")
+        return
+
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(WORKERS),
+               DB_INDEXES_ON_STARTUP='false', NOTIFICATION_WORKER='false')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/test', timeout=2) as response:
+                    assert response.status == 200
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "gunicorn did not start"
+                time.sleep(0.2)
+
+        for _ in range(50):
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/test', timeout=5) as response:
+                assert response.status == 200
+        print(f"✓ 50 requests served by gunicorn on port {port}")
+    finally:
+        server.terminate()
+        output, _ = server.communicate(timeout=30)
+
+    started = output.count("started its background tasks")
+    print(f"Workers that ran post_fork: {started}/{WORKERS}")
+    assert started == WORKERS, output
+    assert "MongoClient opened before fork" not in output, output
+    print("✓ Every worker initialised itself after the fork")
+
+
+def main():
+    check_fork_safety()
+    check_gunicorn()
+    print("\n✅ All multi-worker tests passed")
+
+
+if __name__ == "__main__":
+    main()
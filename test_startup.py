@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test script for app startup
+Imports main and builds the app with no database available: nothing may
+connect, import the optional integrations or exceed the startup budget
+"""
+
+import os
+import sys
+
+# Nothing listens here; any connection attempt would fail or hang
+os.environ['MONGODB_URI'] = 'mongodb://127.0.0.1:9/'
+
+
+def main():
+    import main as rtl
+
+    app = rtl.create_app({'TESTING': True})
+    startup_ms = app.config['STARTUP_MS']
+    print(f"Startup: {startup_ms:.0f} ms (budget {rtl.STARTUP_BUDGET_MS:.0f} ms)")
+    assert startup_ms <= rtl.STARTUP_BUDGET_MS, "startup is over budget"
+    print("✓ Within the startup budget")
+
+    import database
+    assert database._client is None, "importing the app must not create a MongoClient"
+    for module in ('authlib.integrations.flask_client', 'discord_integration', 'requests'):
+        assert module not in sys.modules, f"{module} should be imported on first use"
+    assert not rtl.outbox_worker._thread, "TESTING must not start the notification worker"
+    print("✓ No database client, lazy imports untouched, no background threads")
+
+    response = app.test_client().get('/test')
+    assert response.status_code == 200
+    print("✓ Routes work without a database")
+
+    print("\n✅ All startup tests passed")
+
+
+if __name__ == "__main__":
+    main()
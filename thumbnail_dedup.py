@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Thumbnail deduplication and reference counting
+Identical uploads already share one blob because the store is
+content-addressed; this adds a perceptual hash (dHash) so re-encoded or
+re-saved copies of an image reuse the existing blob (the admin is told),
+and keeps a count of how many levels reference each blob in thumbnails.db
+
+    python thumbnail_dedup.py report          # storage saved, unreferenced blobs
+    python thumbnail_dedup.py rebuild         # index the store, recount from MongoDB
+    python thumbnail_dedup.py prune [--yes]   # delete blobs nothing references
+"""
+
+import hashlib
+import io
+import os
+import sys
+import time
+
+from thumbnail_log import get_connection
+from thumbnail_store import store_thumbnail, thumbnail_path
+from thumbnail_variants import PIL_AVAILABLE, VARIANTS, FORMATS, variant_path, stored_hashes
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+# Largest dHash Hamming distance treated as the same picture; -1 disables
+SIMILAR_DISTANCE = int(os.environ.get('THUMBNAIL_SIMILAR_DISTANCE', '3'))
+# Reuse the stored blob for a near-duplicate upload; false stores the upload and only reports the match
+REUSE_SIMILAR = os.environ.get('THUMBNAIL_REUSE_SIMILAR', 'true').lower() == 'true'
+
+# Near-duplicates must also have (almost) the same aspect ratio and colours
+ASPECT_TOLERANCE = 0.02
+COLOR_TOLERANCE = 8
+
+
+def image_info(data):
+    """Return (dhash hex, colour signature hex, width, height) for image bytes
+
+    All four are None if the image cannot be read.
+    """
+    if not PIL_AVAILABLE:
+        return None, None, None, None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            # 9x8 greyscale: each bit says whether a pixel is brighter than its right neighbour
+            pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+            # dHash ignores colour, so also keep the average colour of a 4x4 grid
+            colors = bytes(channel for pixel in image.convert('RGB').resize((4, 4), Image.BOX).getdata()
+                           for channel in pixel)
+    except (OSError, SyntaxError):
+        return None, None, None, None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:016x}", colors.hex(), width, height
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def color_distance(a, b):
+    """Mean absolute difference between two colour signatures (0-255)"""
+    a, b = bytes.fromhex(a), bytes.fromhex(b)
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+def register_blob(digest, data, info=None):
+    """Add a stored blob to the index (no-op if it is already there)"""
+    phash, colors, width, height = info or image_info(data)
+    get_connection().execute(
+        "INSERT OR IGNORE INTO thumbnail_blobs (hash, phash, colors, size, width, height, refcount, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+        (digest, phash, colors, len(data), width, height, int(time.time()))
+    )
+
+
+def find_similar(phash, colors, width, height):
+    """Closest indexed blob that looks the same and is at least as large, or None"""
+    if SIMILAR_DISTANCE < 0 or not phash or not width or not height:
+        return None
+    best = None
+    rows = get_connection().execute(
+        "SELECT hash, phash, colors, width, height FROM thumbnail_blobs "
+        "WHERE phash IS NOT NULL AND colors IS NOT NULL AND width >= ?",
+        (width,)
+    )
+    for row in rows:
+        if abs(row['width'] / row['height'] - width / height) > ASPECT_TOLERANCE * width / height:
+            continue
+        if color_distance(colors, row['colors']) > COLOR_TOLERANCE:
+            continue
+        distance = hamming(phash, row['phash'])
+        if distance <= SIMILAR_DISTANCE and (best is None or distance < best[0]):
+            if os.path.exists(thumbnail_path(row['hash'])):
+                best = (distance, row['hash'])
+    return best[1] if best else None
+
+
+def dedupe_upload(data, reuse_similar=None):
+    """Store image bytes unless the store already has them or a near-identical image
+
+    Returns (hash, match, similar_to) where match is 'exact', 'similar' or
+    'new' and similar_to is the hash of a near-identical stored image. With
+    reuse_similar (THUMBNAIL_REUSE_SIMILAR) that image's hash is returned
+    instead of storing the upload.
+    """
+    if reuse_similar is None:
+        reuse_similar = REUSE_SIMILAR
+    digest = hashlib.sha256(data).hexdigest()
+    if os.path.exists(thumbnail_path(digest)):
+        register_blob(digest, data)
+        return digest, 'exact', None
+
+    info = image_info(data)
+    similar = find_similar(*info)
+    if similar and reuse_similar:
+        return similar, 'similar', similar
+
+    store_thumbnail(data)
+    register_blob(digest, data, info)
+    return digest, ('similar' if similar else 'new'), similar
+
+
+def add_reference(digest):
+    """A level started using this blob"""
+    if not digest:
+        return
+    conn = get_connection()
+    if conn.execute("UPDATE thumbnail_blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,)).rowcount:
+        return
+    # Blob stored before the index existed (or pasted as /thumbnails/<hash>)
+    path = thumbnail_path(digest)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            register_blob(digest, f.read())
+        conn.execute("UPDATE thumbnail_blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,))
+
+
+def release_reference(digest):
+    """A level stopped using this blob (deleted, or given a new thumbnail)"""
+    if not digest:
+        return
+    get_connection().execute(
+        "UPDATE thumbnail_blobs SET refcount = refcount - 1 WHERE hash = ? AND refcount > 0",
+        (digest,)
+    )
+
+
+def rebuild(db):
+    """Index every blob in the store and recount references from the levels collection"""
+    conn = get_connection()
+    indexed = {row['hash'] for row in conn.execute("SELECT hash FROM thumbnail_blobs")}
+    for digest in stored_hashes():
+        if digest not in indexed:
+            with open(thumbnail_path(digest), 'rb') as f:
+                register_blob(digest, f.read())
+
+    counts = db.levels.aggregate([
+        {"$match": {"thumbnail_hash": {"$type": "string"}}},
+        {"$group": {"_id": "$thumbnail_hash", "count": {"$sum": 1}}}
+    ])
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE thumbnail_blobs SET refcount = 0")
+        for row in counts:
+            conn.execute("UPDATE thumbnail_blobs SET refcount = ? WHERE hash = ?", (row['count'], row['_id']))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def report():
+    """Storage figures from the upload log and the blob index"""
+    conn = get_connection()
+    uploads, uploaded_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM thumbnail_uploads"
+    ).fetchone()
+    blobs, stored_bytes, shared, unreferenced, unreferenced_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), "
+        "COALESCE(SUM(refcount > 1), 0), COALESCE(SUM(refcount = 0), 0), "
+        "COALESCE(SUM(CASE WHEN refcount = 0 THEN size ELSE 0 END), 0) FROM thumbnail_blobs"
+    ).fetchone()
+    references = conn.execute("SELECT COALESCE(SUM(refcount), 0) FROM thumbnail_blobs").fetchone()[0]
+    return {
+        "uploads": uploads,
+        "uploaded_bytes": uploaded_bytes,
+        "blobs": blobs,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": max(uploaded_bytes - stored_bytes, 0),
+        "references": references,
+        "shared_blobs": shared,
+        "unreferenced_blobs": unreferenced,
+        "unreferenced_bytes": unreferenced_bytes,
+    }
+
+
+def prune(db, dry_run=True):
+    """Delete blobs (and their variants) that no level and no history entry references
+
+    Returns the list of hashes removed (or that would be removed).
+    """
+    from level_history import referenced_thumbnail_hashes
+
+    conn = get_connection()
+    candidates = [row['hash'] for row in conn.execute("SELECT hash FROM thumbnail_blobs WHERE refcount = 0")]
+    if not candidates:
+        return []
+    keep = referenced_thumbnail_hashes(db)
+    # The refcount could be stale; trust the levels collection over it
+    keep.update(db.levels.distinct("thumbnail_hash", {"thumbnail_hash": {"$in": candidates}}))
+
+    removed = [digest for digest in candidates if digest not in keep]
+    if dry_run:
+        return removed
+    for digest in removed:
+        paths = [thumbnail_path(digest)] + [variant_path(digest, v, f) for v in VARIANTS for f in FORMATS]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        conn.execute("DELETE FROM thumbnail_blobs WHERE hash = ?", (digest,))
+    return removed
+
+
+def main():
+    from dotenv import load_dotenv
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    if command not in ('report', 'rebuild', 'prune'):
+        print(__doc__)
+        sys.exit(1)
+
+    load_dotenv()
+    from database import get_db
+    db = get_db()
+
+    if command == 'rebuild':
+        rebuild(db)
+        print("✓ Blob index and reference counts rebuilt")
+    elif command == 'prune':
+        dry_run = '--yes' not in sys.argv
+        removed = prune(db, dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        print(f"{verb} {len(removed)} unreferenced blobs")
+        for digest in removed:
+            print(f"  {digest}")
+        if dry_run and removed:
+            print("Run with --yes to delete them")
+
+    stats = report()
+    mb = 1024 * 1024
+    print("Thumbnail storage:")
+    print(f"  Uploads logged:      {stats['uploads']} ({stats['uploaded_bytes'] / mb:.2f} MB)")
+    print(f"  Unique blobs stored: {stats['blobs']} ({stats['stored_bytes'] / mb:.2f} MB)")
+    print(f"  Saved by dedup:      {stats['saved_bytes'] / mb:.2f} MB")
+    print(f"  Level references:    {stats['references']} ({stats['shared_blobs']} blobs shared by several levels)")
+    print(f"  Unreferenced blobs:  {stats['unreferenced_blobs']} ({stats['unreferenced_bytes'] / mb:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
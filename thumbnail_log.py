@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Append-only upload log for thumbnails (replaces thumbnails.json)
+Each upload is one row in SQLite, indexed by level name and hash; the
+image bytes themselves live in the content-addressed thumbnail store.
+The same database holds the blob index used by thumbnail_dedup.py
+
+Import an old thumbnails.json into the log and the blob store with:
+
+    python thumbnail_log.py import thumbnails.json
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+THUMBNAIL_LOG_PATH = os.environ.get(
+    'THUMBNAIL_LOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnail_uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    level_name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    mime_type TEXT,
+    filename TEXT,
+    size INTEGER,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_thumbnail_uploads_level ON thumbnail_uploads (level_name, id);
+CREATE INDEX IF NOT EXISTS idx_thumbnail_uploads_hash ON thumbnail_uploads (hash);
+CREATE TABLE IF NOT EXISTS thumbnail_blobs (
+    hash TEXT PRIMARY KEY,
+    phash TEXT,
+    colors TEXT,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def get_connection():
+    """One connection per thread (and per process, since the path is reopened after fork)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(THUMBNAIL_LOG_PATH, timeout=5, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside a writer and serializes concurrent writers safely
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def append_upload(level_name, digest, mime_type=None, filename=None, size=None, timestamp=None):
+    """Record one upload; O(1) regardless of how many uploads exist"""
+    conn = get_connection()
+    cursor = conn.execute(
+        "INSERT INTO thumbnail_uploads (level_name, hash, mime_type, filename, size, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (level_name, digest, mime_type, filename, size, int(timestamp or time.time()))
+    )
+    return cursor.lastrowid
+
+
+def latest_for_level(level_name):
+    """Most recent upload for a level name, or None"""
+    return get_connection().execute(
+        "SELECT * FROM thumbnail_uploads WHERE level_name = ? ORDER BY id DESC LIMIT 1",
+        (level_name,)
+    ).fetchone()
+
+
+def uploads_for_level(level_name):
+    """Every upload for a level name, oldest first"""
+    return get_connection().execute(
+        "SELECT * FROM thumbnail_uploads WHERE level_name = ? ORDER BY id",
+        (level_name,)
+    ).fetchall()
+
+
+def uploads_for_hash(digest):
+    return get_connection().execute(
+        "SELECT * FROM thumbnail_uploads WHERE hash = ? ORDER BY id",
+        (digest,)
+    ).fetchall()
+
+
+def import_thumbnails_json(path):
+    """Move every entry of an old thumbnails.json into the blob store and the log"""
+    import base64
+    import json
+    from thumbnail_store import store_thumbnail
+
+    with open(path, 'r') as f:
+        thumbnails = json.load(f)
+
+    imported = 0
+    for level_name, entry in thumbnails.items():
+        data = base64.b64decode(entry['base64'])
+        digest = store_thumbnail(data)
+        # Skip entries that a previous run already imported
+        if any(row['level_name'] == level_name for row in uploads_for_hash(digest)):
+            continue
+        append_upload(
+            level_name, digest,
+            mime_type=entry.get('mime_type'),
+            filename=entry.get('filename'),
+            size=len(data),
+            timestamp=entry.get('timestamp')
+        )
+        imported += 1
+    return imported, len(thumbnails)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'import':
+        imported, total = import_thumbnails_json(sys.argv[2])
+        print(f"✓ Imported {imported} of {total} thumbnails from {sys.argv[2]}")
+    else:
+        print("Usage: python thumbnail_log.py import thumbnails.json")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Content-addressed thumbnail store
+Images are saved once under static/uploads/thumbs/ named by their sha256,
+and levels keep only that hash
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+THUMBNAIL_DIR = os.environ.get(
+    'THUMBNAIL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'thumbs')
+)
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of the image formats we accept
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def sniff_image_type(data):
+    """Return the MIME type of an image from its first bytes, or None"""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def is_thumbnail_hash(value):
+    return isinstance(value, str) and bool(HASH_PATTERN.match(value))
+
+
+def thumbnail_path(digest):
+    """Path of the blob for a hash (the file may not exist)"""
+    if not is_thumbnail_hash(digest):
+        raise ValueError(f"Invalid thumbnail hash: {digest!r}")
+    return os.path.join(THUMBNAIL_DIR, digest)
+
+
+def store_thumbnail(data):
+    """Save image bytes and return their sha256 hex digest
+
+    Writing the same bytes twice is a no-op. Files are written to a temp
+    file and renamed into place so readers never see a partial image.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = thumbnail_path(digest)
+    if os.path.exists(path):
+        return digest
+
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=THUMBNAIL_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest
+
+
+def read_thumbnail_type(digest):
+    """MIME type of a stored blob, sniffed from its header"""
+    with open(thumbnail_path(digest), 'rb') as f:
+        return sniff_image_type(f.read(16)) or 'application/octet-stream'
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Validation for uploaded thumbnail files
+Uploads are read in chunks up to a size cap, identified by their magic
+bytes rather than the client's filename or Content-Type, and images that
+are larger than the site ever displays are downscaled before storage
+"""
+
+import io
+import os
+
+from thumbnail_store import sniff_image_type
+from thumbnail_variants import PIL_AVAILABLE
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+# Largest upload accepted, in bytes
+MAX_THUMBNAIL_BYTES = int(os.environ.get('MAX_THUMBNAIL_BYTES', str(8 * 1024 * 1024)))
+
+# Images bigger than this are downscaled to fit (the detail variant is 1280x720)
+MAX_THUMBNAIL_WIDTH = int(os.environ.get('MAX_THUMBNAIL_WIDTH', '1920'))
+MAX_THUMBNAIL_HEIGHT = int(os.environ.get('MAX_THUMBNAIL_HEIGHT', '1080'))
+
+# Files that fit those dimensions but are still this large are re-encoded
+REENCODE_THUMBNAIL_BYTES = int(os.environ.get('REENCODE_THUMBNAIL_BYTES', str(1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ThumbnailRejected(ValueError):
+    """The upload is not an acceptable image; the message is shown to the admin"""
+
+
+def read_upload(stream, max_bytes=None):
+    """Read a file stream in chunks, stopping as soon as it exceeds max_bytes"""
+    max_bytes = max_bytes or MAX_THUMBNAIL_BYTES
+    buffer = io.BytesIO()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.write(chunk)
+        if buffer.tell() > max_bytes:
+            raise ThumbnailRejected(f"Thumbnail is larger than {max_bytes // (1024 * 1024)} MB")
+    return buffer.getvalue()
+
+
+def downscale(data):
+    """Return (data, mime_type) with oversized images shrunk and re-encoded as WebP
+
+    Images already within the limits are returned unchanged.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        # verify() leaves the image unusable, so open it again to work with it
+        with Image.open(io.BytesIO(data)) as image:
+            too_big = image.width > MAX_THUMBNAIL_WIDTH or image.height > MAX_THUMBNAIL_HEIGHT
+            if not too_big and len(data) <= REENCODE_THUMBNAIL_BYTES:
+                return data, None
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ThumbnailRejected(f"Thumbnail could not be read as an image ({e})")
+
+    # thumbnail() keeps the aspect ratio and never enlarges
+    image.thumbnail((MAX_THUMBNAIL_WIDTH, MAX_THUMBNAIL_HEIGHT), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=90, method=4)
+    return buffer.getvalue(), 'image/webp'
+
+
+def validate_upload(file):
+    """Read and check an uploaded FileStorage
+
+    Returns (image bytes, mime type, original size). Raises ThumbnailRejected
+    for files that are too large or are not PNG, JPEG, GIF or WebP images.
+    """
+    data = read_upload(file.stream)
+    if not data:
+        raise ThumbnailRejected("Thumbnail file is empty")
+
+    mime_type = sniff_image_type(data)
+    if not mime_type:
+        raise ThumbnailRejected("Thumbnail must be a PNG, JPEG, GIF or WebP image")
+
+    original_size = len(data)
+    if PIL_AVAILABLE:
+        data, new_type = downscale(data)
+        mime_type = new_type or mime_type
+    return data, mime_type, original_size
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Background thumbnail resize pipeline
+Produces list, detail and placeholder sized variants of every stored
+thumbnail in WebP and JPEG, on a small worker pool after upload
+
+Run directly to generate variants for everything already in the store:
+
+    python thumbnail_variants.py                  # missing variants only
+    python thumbnail_variants.py --placeholders   # also re-render every placeholder
+"""
+
+import base64
+import io
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from thumbnail_store import THUMBNAIL_DIR, thumbnail_path, is_thumbnail_hash
+
+log = logging.getLogger('rtl.thumbnails')
+
+# Try to import Pillow, but don't fail if it's missing (originals are served instead)
+try:
+    from PIL import Image, ImageFilter
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+
+# variant name -> (width, height). Images are cropped to 16:9 before resizing.
+VARIANTS = {
+    'list': (206, 116),
+    'detail': (1280, 720),
+    'placeholder': (24, 14),
+}
+
+# Gaussian blur radius (in placeholder pixels) so the upscaled placeholder looks soft, not blocky
+PLACEHOLDER_BLUR = 1.2
+
+# format name -> (Pillow format, mime type, save options)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+    return _executor
+
+
+def variant_path(digest, variant, fmt):
+    if not is_thumbnail_hash(digest) or variant not in VARIANTS or fmt not in FORMATS:
+        raise ValueError(f"Invalid thumbnail variant: {digest!r} {variant!r} {fmt!r}")
+    return os.path.join(THUMBNAIL_DIR, f"{digest}_{variant}.{fmt}")
+
+
+def _crop_to_aspect(image, width, height):
+    """Centre-crop an image to the target aspect ratio"""
+    src_w, src_h = image.size
+    target = width / height
+    if src_w / src_h > target:
+        new_w = int(src_h * target)
+        left = (src_w - new_w) // 2
+        return image.crop((left, 0, left + new_w, src_h))
+    new_h = int(src_w / target)
+    top = (src_h - new_h) // 2
+    return image.crop((0, top, src_w, top + new_h))
+
+
+def write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render_variant(image, width, height, fmt, blur=0):
+    """Resize an opened image (blurring it by blur pixels) and return the encoded bytes"""
+    pil_format, _, options = FORMATS[fmt]
+    resized = _crop_to_aspect(image, width, height)
+    # Never upscale: small originals keep their own size
+    if resized.width > width:
+        resized = resized.resize((width, height), Image.LANCZOS)
+    if blur:
+        resized = resized.filter(ImageFilter.GaussianBlur(blur))
+    buffer = io.BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(digest, refresh=()):
+    """Create any missing variants (and re-render those named in refresh) for a stored thumbnail
+
+    Returns the list of variant names that exist in every format afterwards.
+    """
+    if not PIL_AVAILABLE:
+        return []
+
+    missing = [
+        (variant, fmt)
+        for variant in VARIANTS for fmt in FORMATS
+        if variant in refresh or not os.path.exists(variant_path(digest, variant, fmt))
+    ]
+    if missing:
+        with Image.open(thumbnail_path(digest)) as original:
+            # First frame only for animated GIFs; JPEG needs RGB
+            image = original.convert('RGB')
+        for variant, fmt in missing:
+            width, height = VARIANTS[variant]
+            blur = PLACEHOLDER_BLUR if variant == 'placeholder' else 0
+            write_atomic(variant_path(digest, variant, fmt), render_variant(image, width, height, fmt, blur))
+
+    return [
+        variant for variant in VARIANTS
+        if all(os.path.exists(variant_path(digest, variant, fmt)) for fmt in FORMATS)
+    ]
+
+
+def placeholder_data_uri(digest):
+    """Smallest encoding of the placeholder variant as an inline data: URI (a few hundred bytes)"""
+    candidates = []
+    for fmt in FORMATS:
+        path = variant_path(digest, 'placeholder', fmt)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                candidates.append((f.read(), fmt))
+    if not candidates:
+        return None
+    data, fmt = min(candidates, key=lambda candidate: len(candidate[0]))
+    return f"data:{FORMATS[fmt][1]};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def variant_fields(digest, variants):
+    """Level fields to $set once variants have been generated"""
+    fields = {"thumbnail_variants": variants}
+    if 'placeholder' in variants:
+        fields["thumbnail_placeholder"] = placeholder_data_uri(digest)
+    return fields
+
+
+def schedule_variants(digest, on_done=None):
+    """Queue variant generation on the worker pool
+
+    on_done(digest, variants) is called from the worker thread when finished.
+    """
+    def run():
+        try:
+            variants = generate_variants(digest)
+        except Exception:
+            log.exception("Thumbnail variant generation failed for %s", digest)
+            return []
+        if on_done:
+            on_done(digest, variants)
+        return variants
+
+    return get_executor().submit(run)
+
+
+def stored_hashes():
+    """Every original blob currently in the store"""
+    if not os.path.isdir(THUMBNAIL_DIR):
+        return []
+    return [name for name in os.listdir(THUMBNAIL_DIR) if is_thumbnail_hash(name)]
+
+
+def main():
+    from dotenv import load_dotenv
+
+    if not PIL_AVAILABLE:
+        print("❌ Pillow is not installed; run `pip install Pillow` first")
+        return
+
+    load_dotenv()
+    from database import get_db
+    db = get_db()
+
+    refresh = ('placeholder',) if '--placeholders' in sys.argv else ()
+    hashes = stored_hashes()
+    print(f"Generating variants for {len(hashes)} thumbnails...")
+    results = get_executor().map(lambda digest: generate_variants(digest, refresh), hashes)
+    for digest, variants in zip(hashes, results):
+        db.levels.update_many({"thumbnail_hash": digest}, {"$set": variant_fields(digest, variants)})
+        print(f"  {digest[:12]}: {', '.join(variants) or 'failed'}")
+    print("✓ Done")
+
+
+if __name__ == "__main__":
+    main()
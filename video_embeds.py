@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Video URL normalization
+Parses a video_url once, when a level or record is written, into the
+platform, video ID and embed URL that templates render
+
+Backfill documents written before video_embed existed with:
+
+    python video_embeds.py [--restart]
+"""
+
+import re
+import sys
+import time
+
+# (platform, compiled pattern with a video_id group, embed URL template)
+VIDEO_PATTERNS = [
+    ('youtube', re.compile(
+        r'^(?:https?://)?(?:www\.|m\.|music\.)?youtube(?:-nocookie)?\.com/'
+        r'(?:watch\?(?:[^#]*&)?v=|embed/|shorts/|live/|v/|e/)'
+        r'(?P<video_id>[A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])',
+        re.IGNORECASE
+    ), 'https://www.youtube.com/embed/{video_id}'),
+    ('youtube', re.compile(
+        r'^(?:https?://)?(?:www\.)?youtu\.be/(?P<video_id>[A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])',
+        re.IGNORECASE
+    ), 'https://www.youtube.com/embed/{video_id}'),
+    ('streamable', re.compile(
+        r'^(?:https?://)?(?:www\.)?streamable\.com/(?:[eos]/)?(?P<video_id>[A-Za-z0-9]+)(?![A-Za-z0-9])',
+        re.IGNORECASE
+    ), 'https://streamable.com/e/{video_id}'),
+    ('tiktok', re.compile(
+        r'^(?:https?://)?(?:www\.|m\.)?tiktok\.com/'
+        r'(?:@[\w.-]+/video/|embed/(?:v2/)?|v/)(?P<video_id>\d+)',
+        re.IGNORECASE
+    ), 'https://www.tiktok.com/embed/v2/{video_id}'),
+]
+
+
+def normalize_video(video_url):
+    """Return {'platform', 'video_id', 'embed_url'} for a video URL, or None"""
+    if not isinstance(video_url, str):
+        return None
+    video_url = video_url.strip()
+    for platform, pattern, embed_template in VIDEO_PATTERNS:
+        match = pattern.match(video_url)
+        if match:
+            video_id = match.group('video_id')
+            return {
+                'platform': platform,
+                'video_id': video_id,
+                'embed_url': embed_template.format(video_id=video_id)
+            }
+    return None
+
+
+def backfill(db, collection_name, restart=False, batch_size=500):
+    """Set video_embed on every document that has a video_url but no video_embed yet
+
+    Returns (documents scanned, documents recognised as embeddable).
+    """
+    from pymongo import UpdateOne
+
+    collection = db[collection_name]
+    query = {"video_url": {"$type": "string"}}
+    if not restart:
+        query["video_embed"] = {"$exists": False}
+
+    scanned = embeddable = 0
+    operations = []
+    for doc in collection.find(query, {"video_url": 1}).batch_size(batch_size):
+        embed = normalize_video(doc['video_url'])
+        scanned += 1
+        if embed:
+            embeddable += 1
+        # Unrecognised URLs get an explicit None so they are not rescanned
+        operations.append(UpdateOne(
+            {"_id": doc['_id'], "video_url": doc['video_url']},
+            {"$set": {"video_embed": embed}}
+        ))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations = []
+            time.sleep(0.05)
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return scanned, embeddable
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from database import get_db
+    db = get_db()
+
+    restart = '--restart' in sys.argv
+    for collection_name in ('levels', 'records'):
+        scanned, embeddable = backfill(db, collection_name, restart=restart)
+        print(f"✓ {collection_name}: {scanned} documents updated, {embeddable} embeddable videos")
+
+
+if __name__ == "__main__":
+    main()
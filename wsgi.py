@@ -0,0 +1,11 @@
+"""
+WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing main does no I/O, so this is safe to load in a preforking master;
+background work starts per worker in gunicorn's post_fork hook (or on a
+worker's first request under other servers).
+"""
+
+from main import app
+
+__all__ = ['app']
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Local cache for YouTube video thumbnails
+Each video's image is fetched once through a pluggable fetcher, resized
+into the variants the templates need and kept on disk. Pages never wait
+for a fetch: a miss is queued for a small pool of background threads and
+served from YouTube meanwhile
+
+Set YOUTUBE_THUMBNAIL_FETCHER=stub to serve generated placeholders instead
+of calling YouTube (handy offline), or to "module:function" to plug in a
+custom fetcher taking a video ID and returning image bytes or None.
+"""
+
+import contextlib
+import importlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from thumbnail_variants import FORMATS, PIL_AVAILABLE, render_variant, write_atomic
+
+log = logging.getLogger('rtl.thumbnails')
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+YOUTUBE_THUMBNAIL_DIR = os.environ.get(
+    'YOUTUBE_THUMBNAIL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'youtube')
+)
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# variant name -> (width, height)
+YOUTUBE_VARIANTS = {
+    'list': (206, 116),
+    'preview': (320, 180),
+}
+
+# Don't retry a video whose thumbnail could not be fetched for this long
+FAILURE_TTL = float(os.environ.get('YOUTUBE_THUMBNAIL_FAILURE_TTL', '600'))
+
+# Background fetches run at once, and how many videos may wait for one
+YOUTUBE_THUMBNAIL_WORKERS = int(os.environ.get('YOUTUBE_THUMBNAIL_WORKERS', '2'))
+YOUTUBE_THUMBNAIL_QUEUE = int(os.environ.get('YOUTUBE_THUMBNAIL_QUEUE', '200'))
+
+_executor = None
+_queued = set()
+
+# video id -> [lock, number of threads using it]; dropped once nobody is fetching
+_locks = {}
+_locks_guard = threading.Lock()
+# video id -> time.monotonic() of its last failed fetch
+_failures = {}
+
+
+def requests_fetcher(video_id):
+    """Fetch the best available thumbnail from img.youtube.com"""
+    import http_client
+
+    for name in ('maxresdefault.jpg', 'hqdefault.jpg'):
+        response = http_client.get(f'https://img.youtube.com/vi/{video_id}/{name}')
+        # YouTube answers 404 when a video has no maxres thumbnail
+        if response.status_code == 200 and response.content:
+            return response.content
+    return None
+
+
+def stub_fetcher(video_id):
+    """Grey placeholder, for running without network access"""
+    if not PIL_AVAILABLE:
+        return None
+    buffer = io.BytesIO()
+    Image.new('RGB', (1280, 720), (108, 117, 125)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def load_fetcher(spec):
+    if not spec or spec == 'requests':
+        return requests_fetcher
+    if spec == 'stub':
+        return stub_fetcher
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+_fetcher = load_fetcher(os.environ.get('YOUTUBE_THUMBNAIL_FETCHER'))
+
+
+def set_fetcher(fetcher):
+    """Replace the fetcher (e.g. with a stub in local development)"""
+    global _fetcher
+    _fetcher = fetcher
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=YOUTUBE_THUMBNAIL_WORKERS, thread_name_prefix='youtube-thumbnail')
+    return _executor
+
+
+def is_video_id(value):
+    return isinstance(value, str) and bool(VIDEO_ID_PATTERN.match(value))
+
+
+def cached_path(video_id, variant, fmt):
+    if not is_video_id(video_id) or variant not in YOUTUBE_VARIANTS or fmt not in FORMATS:
+        raise ValueError(f"Invalid YouTube thumbnail: {video_id!r} {variant!r} {fmt!r}")
+    return os.path.join(YOUTUBE_THUMBNAIL_DIR, video_id, f"{variant}.{fmt}")
+
+
+@contextlib.contextmanager
+def _video_lock(video_id):
+    with _locks_guard:
+        entry = _locks.setdefault(video_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[video_id]
+
+
+def _record_failure(video_id):
+    now = time.monotonic()
+    with _locks_guard:
+        # Forget failures old enough to be retried anyway
+        for stale in [key for key, failed_at in _failures.items() if now - failed_at >= FAILURE_TTL]:
+            del _failures[stale]
+        _failures[video_id] = now
+
+
+def get_thumbnail(video_id, variant, fmt):
+    """Path of a cached variant, fetching and resizing on first use
+
+    Returns None if the image could not be fetched (recently failed
+    fetches are not retried until FAILURE_TTL has passed).
+    """
+    path = cached_path(video_id, variant, fmt)
+    if os.path.exists(path):
+        return path
+
+    failed_at = _failures.get(video_id)
+    if failed_at and time.monotonic() - failed_at < FAILURE_TTL:
+        return None
+
+    # One fetch per video even when many requests arrive at once
+    with _video_lock(video_id):
+        if os.path.exists(path):
+            return path
+        if not PIL_AVAILABLE:
+            return None
+        try:
+            data = _fetcher(video_id)
+        except Exception as e:
+            log.warning("YouTube thumbnail fetch failed for %s: %s", video_id, e)
+            data = None
+        if not data:
+            _record_failure(video_id)
+            return None
+        try:
+            with Image.open(io.BytesIO(data)) as original:
+                image = original.convert('RGB')
+        except (OSError, SyntaxError) as e:
+            # Not an image (an error page, a truncated body): fall back to YouTube for a while
+            log.warning("YouTube thumbnail for %s is not a readable image: %s", video_id, e)
+            _record_failure(video_id)
+            return None
+        with _locks_guard:
+            _failures.pop(video_id, None)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Store every variant now so the next request for any of them is a file hit
+        for name, (width, height) in YOUTUBE_VARIANTS.items():
+            for other_fmt in FORMATS:
+                write_atomic(cached_path(video_id, name, other_fmt), render_variant(image, width, height, other_fmt))
+    return path
+
+
+def cached_thumbnail(video_id, variant, fmt):
+    """Path of a cached variant, or None after queueing a background fetch"""
+    path = cached_path(video_id, variant, fmt)
+    if os.path.exists(path):
+        return path
+    prefetch(video_id)
+    return None
+
+
+def prefetch(video_id):
+    """Fetch a video's thumbnail on a background thread; False if not queued"""
+    failed_at = _failures.get(video_id)
+    if failed_at and time.monotonic() - failed_at < FAILURE_TTL:
+        return False
+    with _locks_guard:
+        if video_id in _queued or len(_queued) >= YOUTUBE_THUMBNAIL_QUEUE:
+            return False
+        _queued.add(video_id)
+
+    def run():
+        try:
+            # Writes every variant, whichever one was asked for
+            get_thumbnail(video_id, 'list', 'jpeg')
+        except Exception:
+            log.exception("YouTube thumbnail prefetch failed for %s", video_id)
+        finally:
+            with _locks_guard:
+                _queued.discard(video_id)
+
+    get_executor().submit(run)
+    return True